@@ -1,5 +1,13 @@
+import functools
+import results
 import tax_bracket
+import tracing
+from typing import Callable
 from typing import List
+from typing import Dict
+from typing import Optional
+from ledger import LinkedLedger
+from ledger import YearLedger
 from tax_deductions import StandardDeductions
 
 
@@ -7,31 +15,66 @@ def _compound_monthly_interest(annual_rate):
     return (1 + annual_rate) ** (1 / 12) - 1
 
 
+@functools.lru_cache(maxsize=4096)
+def _monthly_growth_factor(annual_rate: float) -> float:
+    return 1.0 + _compound_monthly_interest(annual_rate)
+
+
+def _growth_factor(inflate_percent: Callable[[int], float], from_date: int, to_date: int) -> float:
+    # Each month is credited to the year it ends in, so a one month step into
+    # january uses the new year's rate. Longer gaps take one pow per year.
+    factor = 1.0
+    date = from_date
+    while date < to_date:
+        year = (date + 1) // 12
+        year_end = min(year * 12 + 11, to_date)
+        factor *= _monthly_growth_factor(inflate_percent(year)) ** (year_end - date)
+        date = year_end
+    return factor
+
+
 class Account:
+    __slots__ = ("amount", "name", "inflate_percent", "date", "withdrawn_per_year", "added_per_year",
+                 "inflate_percent_by_year")
+
     def __init__(self, name: str, amount: float, inflate_percent: float,
                  year: int, month: int):
         self.amount = float(amount)
         self.name = str(name)
         self.inflate_percent = inflate_percent
         self.date = year * 12 + (month - 1)
-        self.withdrawn_per_year = {}
-        self.added_per_year = {}
+        self.withdrawn_per_year = YearLedger()
+        self.added_per_year = YearLedger()
         self.inflate_percent_by_year = {}
 
     def __str__(self) -> str:
         return f"{self.name}: ${self.amount:,.2f}"
 
+    def row_header(self) -> List[results.Column]:
+        return [results.Column(self.name, results.MONEY), results.Column(f"{self.name}-pay", results.MONEY)]
+
+    def row_values(self, year: int) -> List[float]:
+        return [self.amount, self.withdraw_by_year(year) - self.added_per_year.get(year, 0)]
+
     def csv_header(self) -> str:
-        return f";{self.name};{self.name}-pay"
+        return results.format_header(self.row_header())
 
     def csv_values(self, year: int) -> str:
-        return f";${self.amount:,.2f};${self.withdraw_by_year(year) -  self.added_per_year.get(year, 0):,.2f}"
+        return results.format_row(self.row_header(), self.row_values(year))
 
     def increase(self, year: int, month: int):
         current_date = year * 12 + (month - 1)
-        while self.date < current_date:
-            self.amount *= (1.0 + _compound_monthly_interest(self._inflate_percent(year)))
-            self.date += 1
+        if self.date < current_date:
+            self.amount *= _growth_factor(self._inflate_percent, self.date, current_date)
+            self.date = current_date
+
+    def growth_factor(self, date: int) -> float:
+        return _growth_factor(self._inflate_percent, self.date, date)
+
+    def grow(self, factor: float, date: int):
+        # increase() with the growth factor worked out by the caller
+        self.amount *= factor
+        self.date = date
 
     def set_inflate_percent_by_year(self, inflate_percent_by_year):
         self.inflate_percent_by_year = inflate_percent_by_year
@@ -39,12 +82,26 @@ class Account:
     def _inflate_percent(self, year):
         return self.inflate_percent_by_year.get(year, self.inflate_percent)
 
+    def monthly_growth_bound(self, year: int) -> float:
+        return _monthly_growth_factor(self._inflate_percent(year))
+
+    def snapshot(self) -> tuple:
+        return self.amount, self.date, self.withdrawn_per_year.copy(), self.added_per_year.copy()
+
+    def restore(self, state: tuple):
+        self.amount, self.date, withdrawn_per_year, added_per_year = state
+        self.withdrawn_per_year = withdrawn_per_year.copy()
+        self.added_per_year = added_per_year.copy()
+
     def taxable_income(self, year: int) -> float:
         return 0.0
 
     def cap_taxable_income(self, year: int) -> float:
         return 0.0
 
+    def balances(self) -> Dict[str, float]:
+        return {self.name: self.amount}
+
     def withdraw_by_year(self, year: int) -> float:
         w = self.withdrawn_per_year.get(year, 0.0)
         return w if w >= 0.0 else 0.0
@@ -71,11 +128,17 @@ class Account:
             self.withdrawn_per_year[year] = withdraw_amount + self.withdrawn_per_year.get(year, 0)
             return 0.0
 
+    def withdraw_start_year(self) -> Optional[int]:
+        # first year withdraw takes money out, None when it always does
+        return None
+
     def total_taxable_pension_payments(self, amount: float, year: int):
         pass
 
 
 class PreTax401k(Account):
+    __slots__ = ("min_year",)
+
     def __init__(self, name: str, amount: float, min_year: int,
                  inflate_percent: float, start_year: int, start_month: int):
         super(PreTax401k, self).__init__(name, amount, inflate_percent, start_year, start_month)
@@ -87,8 +150,12 @@ class PreTax401k(Account):
         else:
             return withdraw_amount  # left over
 
+    def withdraw_start_year(self) -> Optional[int]:
+        return self.min_year
+
 
 class Taxable(Account):
+    __slots__ = ()
 
     def __init__(self, name: str, amount: float, inflate_percent: float, start_year: int, start_month: int):
         super(Taxable, self).__init__(name, amount, inflate_percent, start_year, start_month)
@@ -98,6 +165,8 @@ class Taxable(Account):
 
 
 class TaxableWithBasis:
+    __slots__ = ("amount_basis", "amount_gains", "name", "inflate_percent", "date", "withdrawn_per_year",
+                 "added_per_year", "inflate_percent_by_year")
 
     def __init__(self, name: str, amount_basis: float, amount_gains: float, inflate_percent: float, start_year: int, start_month: int):
         self.amount_basis = float(amount_basis)
@@ -105,8 +174,8 @@ class TaxableWithBasis:
         self.name = str(name)
         self.inflate_percent = inflate_percent
         self.date = start_year * 12 + (start_month - 1)
-        self.withdrawn_per_year = {}
-        self.added_per_year = {}
+        self.withdrawn_per_year = YearLedger()
+        self.added_per_year = YearLedger()
         self.inflate_percent_by_year = {}
 
     def _total_amount(self):
@@ -115,17 +184,35 @@ class TaxableWithBasis:
     def __str__(self) -> str:
         return f"{self.name}: ${self._total_amount():,.2f}"
 
+    def row_header(self) -> List[results.Column]:
+        return [results.Column(f"{self.name}-basis", results.MONEY),
+                results.Column(f"{self.name}-gains", results.MONEY),
+                results.Column(f"{self.name}-total", results.MONEY),
+                results.Column(f"{self.name}-pay", results.MONEY)]
+
+    def row_values(self, year: int) -> List[float]:
+        return [self.amount_basis, self.amount_gains, self._total_amount(),
+                self.withdraw_by_year(year) - self.added_per_year.get(year, 0)]
+
     def csv_header(self) -> str:
-        return f";{self.name}-basis;{self.name}-gains;{self.name}-total;{self.name}-pay"
+        return results.format_header(self.row_header())
 
     def csv_values(self, year: int) -> str:
-        return f";${self.amount_basis:,.2f};${self.amount_gains:,.2f};${self._total_amount():,.2f};${self.withdraw_by_year(year) -  self.added_per_year.get(year, 0):,.2f}"
+        return results.format_row(self.row_header(), self.row_values(year))
 
     def increase(self, year: int, month: int):
         current_date = year * 12 + (month - 1)
-        while self.date < current_date:
-            self.amount_gains += self._total_amount() * _compound_monthly_interest(self._inflate_percent(year))
-            self.date += 1
+        if self.date < current_date:
+            self.amount_gains += self._total_amount() * (_growth_factor(self._inflate_percent, self.date,
+                                                                        current_date) - 1.0)
+            self.date = current_date
+
+    def growth_factor(self, date: int) -> float:
+        return _growth_factor(self._inflate_percent, self.date, date)
+
+    def grow(self, factor: float, date: int):
+        self.amount_gains += self._total_amount() * (factor - 1.0)
+        self.date = date
 
     def set_inflate_percent_by_year(self, inflate_percent_by_year):
         self.inflate_percent_by_year = inflate_percent_by_year
@@ -133,6 +220,18 @@ class TaxableWithBasis:
     def _inflate_percent(self, year):
         return self.inflate_percent_by_year.get(year, self.inflate_percent)
 
+    def monthly_growth_bound(self, year: int) -> float:
+        return _monthly_growth_factor(self._inflate_percent(year))
+
+    def snapshot(self) -> tuple:
+        return (self.amount_basis, self.amount_gains, self.date,
+                self.withdrawn_per_year.copy(), self.added_per_year.copy())
+
+    def restore(self, state: tuple):
+        self.amount_basis, self.amount_gains, self.date, withdrawn_per_year, added_per_year = state
+        self.withdrawn_per_year = withdrawn_per_year.copy()
+        self.added_per_year = added_per_year.copy()
+
     def taxable_income(self, year: int) -> float:
         return 0.0
 
@@ -143,6 +242,9 @@ class TaxableWithBasis:
         else:
             return 0
 
+    def balances(self) -> Dict[str, float]:
+        return {self.name: self._total_amount()}
+
     def withdraw_by_year(self, year: int) -> float:
         w = self.withdrawn_per_year.get(year, 0.0)
         return w if w >= 0.0 else 0.0
@@ -159,7 +261,7 @@ class TaxableWithBasis:
     def withdraw(self, withdraw_amount: float, year: int) -> float:
         if withdraw_amount < 0.0:
             raise Exception(f"can not withdraw negative amounts: withdraw_amount: ${withdraw_amount:,.2f}")
-        if withdraw_amount > self._total_amount():
+        if withdraw_amount > self._total_amount() or self._total_amount() <= 0.0:
             left_over = withdraw_amount - self._total_amount()
             self.amount_basis = 0
             self.amount_gains = 0
@@ -172,6 +274,9 @@ class TaxableWithBasis:
             self.withdrawn_per_year[year] = withdraw_amount + self.withdrawn_per_year.get(year, 0)
             return 0.0
 
+    def withdraw_start_year(self) -> Optional[int]:
+        return None
+
     def total_taxable_pension_payments(self, amount: float, year: int):
         pass
 
@@ -202,13 +307,14 @@ class RMD(object):
 
 
 class PostTax401k(Account):
+    __slots__ = ("born_year", "min_age", "rmd_by_year")
 
     def __init__(self, name: str, amount: float, born_year: int,
                  inflate_percent: float, start_year: int, start_month: int, min_age: int = 60):
         super(PostTax401k, self).__init__(name, amount, inflate_percent, start_year, start_month)
         self.born_year = born_year
         self.min_age = min_age
-        self.rmd_by_year = {}
+        self.rmd_by_year = YearLedger()
 
     def withdraw(self, withdraw_amount: float, year: int) -> float:
         if year - self.born_year >= self.min_age:
@@ -216,9 +322,20 @@ class PostTax401k(Account):
         else:
             return withdraw_amount
 
+    def withdraw_start_year(self) -> Optional[int]:
+        return self.born_year + self.min_age
+
     def conversion(self, withdraw_amount: float, year: int) -> float:
         return super().withdraw(withdraw_amount, year)
 
+    def snapshot(self) -> tuple:
+        return super().snapshot(), self.rmd_by_year.copy()
+
+    def restore(self, state: tuple):
+        account_state, rmd_by_year = state
+        super().restore(account_state)
+        self.rmd_by_year = rmd_by_year.copy()
+
     def taxable_income(self, year: int) -> float:
         return self.withdraw_by_year(year)
 
@@ -231,7 +348,8 @@ class PostTax401k(Account):
 
 
 class PostTax401kRateLimit(object):
-    logging = False
+    __slots__ = ("name", "accounts", "income_tax_brackets", "max_tax_percent", "standard_deductions",
+                 "pension_payment_by_year", "percent_over_max", "withdrawn_total_by_year", "rmd_by_year")
 
     def __init__(self, name: str, accounts: List[PostTax401k],
                  income_tax_brackets: tax_bracket.TaxBracketCollection,
@@ -243,31 +361,70 @@ class PostTax401kRateLimit(object):
         self.income_tax_brackets = income_tax_brackets
         self.max_tax_percent = max_tax_percent
         self.standard_deductions = standard_deductions
-        self.pension_payment_by_year = {}
+        self.pension_payment_by_year = YearLedger()
         self.percent_over_max = percent_over_max
+        # running totals over the accounts, the monthly withdraw doesn't scan them
+        self.withdrawn_total_by_year = YearLedger()
+        self.rmd_by_year = YearLedger()
+        for acc in accounts:
+            withdrawn = acc.withdrawn_per_year
+            for year, amount in withdrawn.items():
+                self.withdrawn_total_by_year[year] = self.withdrawn_total_by_year.get(year, 0.0) + amount
+            acc.withdrawn_per_year = LinkedLedger(self.withdrawn_total_by_year, withdrawn.first_year,
+                                                  withdrawn.values)
+
+    def row_header(self) -> List[results.Column]:
+        output = []
+        for acc in self.accounts:
+            output.extend(acc.row_header())
+            output.append(results.Column(f"{acc.name}-rmd", results.MONEY))
+        return output
 
-    def csv_header(self) -> str:
-        output = ""
+    def row_values(self, year: int) -> List[float]:
+        output = []
         for acc in self.accounts:
-            output += f"{acc.csv_header()}"
-            output += f";{acc.name}-rmd"
+            output.extend(acc.row_values(year))
+            output.append(acc.required_yearly_withdraw(year))
         return output
 
+    def csv_header(self) -> str:
+        return results.format_header(self.row_header())
+
     def total_taxable_pension_payments(self, amount: float, year: int):
         self.pension_payment_by_year[year] = amount
 
     def csv_values(self, year: int) -> str:
-        output = ""
-        for acc in self.accounts:
-            output += f"{acc.csv_values(year)}"
-            output += f";${acc.required_yearly_withdraw(year):,.2f}"
+        return results.format_row(self.row_header(), self.row_values(year))
 
+    def balances(self) -> Dict[str, float]:
+        output = {}
+        for acc in self.accounts:
+            output.update(acc.balances())
         return output
 
+    def snapshot(self) -> tuple:
+        return (self.pension_payment_by_year.copy(), self.max_tax_percent, self.percent_over_max,
+                self.withdrawn_total_by_year.copy(), self.rmd_by_year.copy(),
+                [acc.snapshot() for acc in self.accounts])
+
+    def restore(self, state: tuple):
+        (pension_payment_by_year, self.max_tax_percent, self.percent_over_max, withdrawn_total_by_year, rmd_by_year,
+         account_states) = state
+        self.pension_payment_by_year = pension_payment_by_year.copy()
+        self.withdrawn_total_by_year = withdrawn_total_by_year.copy()
+        self.rmd_by_year = rmd_by_year.copy()
+        for acc, account_state in zip(self.accounts, account_states):
+            acc.restore(account_state)
+            # the restored ledger is a copy still adding to the total it was copied with
+            acc.withdrawn_per_year.total = self.withdrawn_total_by_year
+
     def increase(self, year: int, month: int):
         for acc in self.accounts:
             acc.increase(year, month)
 
+    def monthly_growth_bound(self, year: int) -> float:
+        return max(acc.monthly_growth_bound(year) for acc in self.accounts)
+
     def conversion(self, amount: float, year: int) -> float:
         withdraw_amount = amount
         for acc in self.accounts:
@@ -279,20 +436,31 @@ class PostTax401kRateLimit(object):
         max_low_tax_bracket = self._max_low_tax_bracket()
         required_yearly_withdraw = self.required_yearly_withdraw(year)
         already_withdraw = self.withdrawn_per_year(year)
-        self._log(f"({year}) (${withdraw_amount:,.2f}) max_low_tax_bracket: {max_low_tax_bracket:,.2f} required_yearly_withdraw: {required_yearly_withdraw:,.2f} already_withdraw:{already_withdraw:,.2f}")
+        if tracing.sink is not None:
+            tracing.emit("rmd", self.name, None, year, withdraw_amount=withdraw_amount,
+                         max_low_tax_bracket=max_low_tax_bracket, required_yearly_withdraw=required_yearly_withdraw,
+                         already_withdraw=already_withdraw)
         if required_yearly_withdraw > 0.0:
             can_withdraw = min(max(required_yearly_withdraw - already_withdraw, 0), withdraw_amount)
             amount_left = can_withdraw
             for acc in self.accounts:
+                if amount_left == 0.0 and tracing.sink is None:
+                    # asking the other accounts for nothing changes nothing
+                    break
                 if acc.required_yearly_withdraw(year) > acc.withdraw_by_year(year):
                     required_amount_left = acc.required_yearly_withdraw(year) - acc.withdraw_by_year(year)
                     if amount_left > required_amount_left:
                         amount_left = acc.withdraw(required_amount_left, year) + (amount_left-required_amount_left)
-                        self._log(f"- 1({acc.name}) can_withdraw: {can_withdraw:,.2f} amount_left: {amount_left:,.2f} withdrawn/required_amount_left: {required_amount_left:,.2f} ")
+                        if tracing.sink is not None:
+                            tracing.emit("rmd_required", self.name, acc.name, year, can_withdraw=can_withdraw,
+                                         amount_left=amount_left, withdrawn=required_amount_left,
+                                         required_amount_left=required_amount_left)
                     else:
                         w = amount_left
                         amount_left = acc.withdraw(w, year)
-                        self._log(f"- 2({acc.name}) can_withdraw: {can_withdraw:,.2f} amount_left: {amount_left:,.2f} withdrawn: {w:,.2f} required_amount_left: {required_amount_left:,.2f} ")
+                        if tracing.sink is not None:
+                            tracing.emit("rmd_partial", self.name, acc.name, year, can_withdraw=can_withdraw,
+                                         amount_left=amount_left, withdrawn=w, required_amount_left=required_amount_left)
             withdraw_amount = amount_left + (withdraw_amount - can_withdraw)
 
         return withdraw_amount
@@ -308,46 +476,52 @@ class PostTax401kRateLimit(object):
 
         total_taxable_income = total_taxable_income + (withdraw_amount - left_over)
 
-        self._log(f"- wa_after_rmd: {left_over:,.2f}")
+        if tracing.sink is not None:
+            tracing.emit("after_rmd", self.name, None, year, left_over=left_over)
         if total_taxable_income + left_over < max_amount_to_withdraw:
             for acc in self.accounts:
+                if left_over == 0.0 and tracing.sink is None:
+                    break
                 w = left_over
                 left_over = acc.withdraw(w, year)
-                self._log(f"- aw + wa < max ({acc.name}) withdrawn: {w:,.2f} left_over: {left_over:,.2f}")
+                if tracing.sink is not None:
+                    tracing.emit("under_max", self.name, acc.name, year, withdrawn=w, left_over=left_over)
             return left_over
         else:
             can_withdraw = min(max(max_amount_to_withdraw - total_taxable_income, 0), left_over)
             amount_left = can_withdraw
             for acc in self.accounts:
+                if amount_left == 0.0 and tracing.sink is None:
+                    break
                 w = amount_left
                 amount_left = acc.withdraw(w, year)
-                self._log(f"- aw + wa >= max ({acc.name}) withdrawn: {w:,.2f} left_over: {amount_left:,.2f} can_withdraw: {can_withdraw:,.2f}")
+                if tracing.sink is not None:
+                    tracing.emit("over_max", self.name, acc.name, year, withdrawn=w, left_over=amount_left,
+                                 can_withdraw=can_withdraw)
             return amount_left + (left_over - can_withdraw)
 
-    @classmethod
-    def _log(cls, message: str):
-        if cls.logging:
-            print(message)
+    def withdraw_start_year(self) -> Optional[int]:
+        # the required withdraws of a year are fixed by its first withdraw, see WithdrawPlan
+        return None
 
     def withdrawn_per_year(self, year) -> float:
-        total = 0
-        for acc in self.accounts:
-            total += acc.withdrawn_per_year.get(year, 0)
-        return total
+        return self.withdrawn_total_by_year.get(year, 0)
 
     def taxable_income(self, year: int) -> float:
-        amount = 0
-        for acc in self.accounts:
-            amount += acc.taxable_income(year)
-        return amount
+        # every account's withdrawn amount is at least 0, so is their sum
+        return max(self.withdrawn_total_by_year.get(year, 0.0), 0.0)
 
     def cap_taxable_income(self, year: int) -> float:
         return 0.0
 
     def required_yearly_withdraw(self, year: int) -> float:
-        amount = 0
-        for acc in self.accounts:
-            amount += acc.required_yearly_withdraw(year)
+        # an account's required withdraw is fixed the first time it is asked for in a year
+        amount = self.rmd_by_year.get(year)
+        if amount is None:
+            amount = 0
+            for acc in self.accounts:
+                amount += acc.required_yearly_withdraw(year)
+            self.rmd_by_year[year] = amount
         return amount
 
     def _max_low_tax_bracket(self) -> float:
@@ -0,0 +1,101 @@
+import array
+from typing import Dict
+from typing import Mapping
+from typing import Sequence
+from typing import Tuple
+
+# Accounts invested in a mix of asset classes. Each asset class is a rate path: "stocks"
+# is the market path, others are a fixed rate or a csv in the format of s_p_500.csv
+# replayed from the same historic year. An account's rate for a year is the weighted
+# sum of its classes' rates that year, rebalanced once a year, and the weights can glide
+# with age. The blended rates of a path are worked out once into an array that accounts
+# use like any other rate dict, so more asset classes add no work per month.
+
+STOCKS = "stocks"
+
+
+class Allocation(object):
+    """
+    Weights per asset class by age, [(age, {asset class: weight}), ...]. Between two
+    ages the weights move linearly, before the first and after the last they stay put.
+    """
+
+    def __init__(self, points: Sequence[Tuple[int, Mapping[str, float]]], born_year: int = 0):
+        if not points:
+            raise ValueError("an allocation needs weights")
+        self.points = sorted((age, dict(weights)) for age, weights in points)
+        self.born_year = born_year
+        self.asset_classes = sorted({name for _, weights in self.points for name in weights})
+        for age, weights in self.points:
+            check_weights(weights, f"weights at age {age}")
+
+    @classmethod
+    def fixed(cls, weights: Mapping[str, float]) -> "Allocation":
+        return cls([(0, weights)])
+
+    def weights(self, year: int) -> Dict[str, float]:
+        age = year - self.born_year
+        points = self.points
+        if age <= points[0][0]:
+            return points[0][1]
+        for (from_age, from_weights), (to_age, to_weights) in zip(points, points[1:]):
+            if age <= to_age:
+                t = (age - from_age) / (to_age - from_age)
+                return {name: from_weights.get(name, 0.0) * (1 - t) + to_weights.get(name, 0.0) * t
+                        for name in self.asset_classes}
+        return points[-1][1]
+
+
+def check_weights(weights: Mapping[str, float], where: str):
+    for name, weight in weights.items():
+        if not isinstance(weight, (int, float)) or isinstance(weight, bool) or weight < 0:
+            raise ValueError(f"{where}: {name} must be a number of at least 0, not {weight!r}")
+    if abs(sum(weights.values()) - 1.0) > 1e-6:
+        raise ValueError(f"{where}: weights must add up to 1, not {sum(weights.values())}")
+
+
+class BlendedRates(object):
+    """
+    Rates of an allocation from start_year on, used like the rate dicts accounts take.
+    class_rates has a rate dict and a rate for the years it has no rate for, per asset class.
+    """
+    __slots__ = ("allocation", "class_rates", "start_year", "rates")
+
+    def __init__(self, allocation: Allocation, class_rates: Dict[str, Tuple[Mapping[int, float], float]],
+                 start_year: int, end_year: int):
+        missing = set(allocation.asset_classes) - set(class_rates)
+        if missing:
+            raise ValueError(f"no rates for asset classes {', '.join(sorted(missing))}")
+        self.allocation = allocation
+        self.class_rates = class_rates
+        self.start_year = start_year
+        self.rates = array.array("d")
+        self._extend(end_year)
+
+    def rate(self, year: int) -> float:
+        rate = 0.0
+        for name, weight in self.allocation.weights(year).items():
+            rates, default_rate = self.class_rates[name]
+            rate += weight * rates.get(year, default_rate)
+        return rate
+
+    def _extend(self, year: int):
+        rates = self.rates
+        for y in range(self.start_year + len(rates), year + 1):
+            rates.append(self.rate(y))
+
+    def get(self, year: int, default: float = None) -> float:
+        index = year - self.start_year
+        if index < 0:
+            return default
+        if index >= len(self.rates):
+            self._extend(year)
+        return self.rates[index]
+
+    def __getitem__(self, year: int) -> float:
+        if year < self.start_year:
+            return self.rate(year)
+        return self.get(year)
+
+    def __contains__(self, year: int) -> bool:
+        return year >= self.start_year
@@ -0,0 +1,175 @@
+import argparse
+import time
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+import historical_recast
+import scenario_file
+import tax_bracket
+from simulation import ANNUAL_WITHDRAW_MONTH
+from simulation import END_YEAR
+from simulation import Simulation
+from simulation import SimulationResult
+from tax_deductions import StandardDeductions
+from yearly_withdraw_manager import Expenses
+from yearly_withdraw_manager import YearlyWithdrawManager
+
+# Many portfolios stepped together on one rate path. Their managers share the tax
+# brackets and standard deductions of a SharedPath, which then inflate once a year for
+# all of them, and pensions and expenses already share their inflation indexes. Account
+# growth is worked out once per month for every rate path the accounts grow on and
+# applied to all accounts on it. Balances, ledgers and taxes stay per portfolio, and
+# every portfolio ends up exactly where its own Simulation would have.
+
+
+class SharedPath(object):
+    def __init__(self, market: Dict[int, float], inflation: Dict[int, float]):
+        self.market = market
+        self.inflation = inflation
+        self.income_tax_brackets = tax_bracket.build_current_income_tax_brackets(inflation)
+        self.cap_gains_tax_brackets = tax_bracket.build_current_cap_gains_tax_brackets(inflation)
+        self.standard_deductions = StandardDeductions()
+
+
+class BatchSimulation(object):
+    def __init__(self, portfolios: List[Tuple[YearlyWithdrawManager, Expenses]], start_year: int,
+                 end_year: int = END_YEAR, annual: bool = False):
+        if not portfolios:
+            raise ValueError("no portfolios")
+        first = portfolios[0][0]
+        for manager, _ in portfolios:
+            if manager.income_tax_brackets is not first.income_tax_brackets or \
+                    manager.cap_gains_tax_brackets is not first.cap_gains_tax_brackets or \
+                    manager.standard_deductions is not first.standard_deductions:
+                raise ValueError("portfolios must share their tax brackets and standard deductions, "
+                                 "build them on one SharedPath")
+        self.simulations = [Simulation(manager, expenses, start_year, end_year, annual)
+                            for manager, expenses in portfolios]
+        self.year = start_year
+        self.end_year = end_year
+        self.annual = annual
+        self._live = list(self.simulations)
+        self._groups = self._group()
+
+    def _group(self) -> list:
+        # accounts growing on the same rates from the same month, they stay in step
+        groups = {}
+        for simulation in self._live:
+            for acc in simulation.manager.saving_accounts:
+                for sub in getattr(acc, "accounts", [acc]):
+                    key = (id(sub.inflate_percent_by_year), sub.inflate_percent, sub.date)
+                    groups.setdefault(key, []).append(sub)
+        return list(groups.values())
+
+    def _grow(self, year: int, month: int):
+        date = year * 12 + (month - 1)
+        for group in self._groups:
+            first = group[0]
+            if first.date < date:
+                factor = first.growth_factor(date)
+                for acc in group:
+                    acc.grow(factor, date)
+        for simulation in self._live:
+            for pension in simulation.manager.pension_accounts:
+                pension.increase(year, month)
+
+    def _drop_failed(self):
+        live = [simulation for simulation in self._live if simulation.failure_year is None]
+        if len(live) != len(self._live):
+            self._live = live
+            self._groups = self._group()
+
+    def step(self):
+        year = self.year
+        incomes = [(simulation, simulation._start_year(year)) for simulation in self._live]
+        if self.annual:
+            self._grow(year, ANNUAL_WITHDRAW_MONTH)
+            for simulation, yearly_income in incomes:
+                simulation._withdraw_year(year, yearly_income)
+            self._drop_failed()
+            self._grow(year, 12)
+        else:
+            for month in range(1, 13):
+                self._grow(year, month)
+                for simulation, yearly_income in incomes:
+                    if simulation.failure_year is None:
+                        simulation._withdraw_month(year, yearly_income)
+                self._drop_failed()
+
+        for simulation in self._live:
+            simulation._end_year(year)
+        self.year += 1
+
+    def run(self) -> List[bool]:
+        while self._live and self.year <= self.end_year:
+            self.step()
+        return [simulation.failure_year is None for simulation in self.simulations]
+
+    def results(self, start_historic_year: int) -> List[SimulationResult]:
+        return [simulation.result(start_historic_year) for simulation in self.simulations]
+
+
+def run_templates(templates: List[scenario_file.ScenarioTemplate], start_historic_year: int,
+                  end_year: int = END_YEAR, annual: bool = False,
+                  scales: List[float] = None) -> List[SimulationResult]:
+    """
+    Every scenario file template on the rate path of start_historic_year, with its
+    expenses scaled by scales[i] when given.
+    """
+    first = templates[0]
+    for template in templates:
+        if (template.start_year, template.market_rate, template.inflation_rate) != \
+                (first.start_year, first.market_rate, first.inflation_rate):
+            raise ValueError(f"{template.name}: start_year, market_rate and inflation_rate differ from {first.name}, "
+                             f"so the rate paths do too")
+    market = historical_recast.get_s_p_500_year_rate(first.start_year, start_historic_year, first.market_rate)
+    inflation = historical_recast.get_inflation_year_rate(first.start_year, start_historic_year, first.inflation_rate)
+    path = SharedPath(market, inflation)
+
+    portfolios = []
+    for i, template in enumerate(templates):
+        manager, expenses, _ = template.on_path(market, inflation, path, template.asset_rates(start_historic_year))
+        if scales:
+            expenses.scale(scales[i])
+        portfolios.append((manager, expenses))
+    simulation = BatchSimulation(portfolios, first.start_year, end_year, annual)
+    simulation.run()
+    return simulation.results(start_historic_year)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Time a batch of portfolios against simulating them one by one.")
+    parser.add_argument("--scenario", default="scenario_files/example.toml")
+    parser.add_argument("--portfolios", type=int, default=100)
+    parser.add_argument("--start-historic-year", type=int, default=1966)
+    parser.add_argument("--end-year", type=int, default=END_YEAR)
+    parser.add_argument("--annual", action="store_true")
+    args = parser.parse_args(argv)
+
+    template = scenario_file.load(args.scenario)
+    # the same scenario spending from half to one and a half times as much
+    scales = [0.5 + i / args.portfolios for i in range(args.portfolios)]
+
+    start = time.perf_counter()
+    one_by_one = []
+    for scale in scales:
+        manager, expenses, start_year = template(args.start_historic_year)
+        expenses.scale(scale)
+        simulation = Simulation(manager, expenses, start_year, args.end_year, args.annual)
+        simulation.run()
+        one_by_one.append(simulation.result(args.start_historic_year))
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = run_templates([template] * args.portfolios, args.start_historic_year, args.end_year, args.annual,
+                            scales)
+    batch_seconds = time.perf_counter() - start
+
+    same = all(a.failure_year == b.failure_year and a.balances == b.balances for a, b in zip(one_by_one, batched))
+    print(f"{args.portfolios} portfolios: one by one {single_seconds:.3f}s, batched {batch_seconds:.3f}s "
+          f"({single_seconds / batch_seconds:.2f}x), identical results: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+
+from benchmarks import runner
+
+sys.exit(runner.main())
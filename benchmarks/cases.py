@@ -0,0 +1,115 @@
+import os
+import tempfile
+from typing import Callable
+from typing import List
+
+import results
+from simulation import END_YEAR
+from simulation import Simulation
+from sweep import FIRST_HISTORIC_YEAR
+from sweep import LAST_HISTORIC_YEAR
+from benchmarks import portfolios
+
+# A case does its untimed setup for a portfolio of `accounts` accounts and
+# returns run(). Only run() is timed, it returns how many simulated months it covered.
+
+Case = Callable[[int], Callable[[], int]]
+
+
+def sweep(accounts: int):
+    simulations = []
+    for year in range(FIRST_HISTORIC_YEAR, LAST_HISTORIC_YEAR + 1):
+        manager, expenses, start_year = portfolios.build(accounts, year)
+        simulations.append(Simulation(manager, expenses, start_year, END_YEAR))
+
+    def run():
+        months = 0
+        for simulation in simulations:
+            simulation.run()
+            months += (simulation.year - portfolios.START_YEAR) * 12
+        return months
+
+    return run
+
+
+def run_with_write(accounts: int):
+    manager, expenses, start_year = portfolios.build(accounts, 1990)
+    simulation = Simulation(manager, expenses, start_year, END_YEAR)
+    file_name = os.path.join(tempfile.gettempdir(), f"benchmark-{accounts}.csv")
+
+    # what main.run_with_write does, every year formatted into the human readable csv
+    def run():
+        with results.CsvSink(file_name, human=True) as sink:
+            sink.open(manager.row_header())
+            simulation.run(on_year=lambda year: sink.write(manager.row_values(year)))
+        return (simulation.year - start_year) * 12
+
+    return run
+
+
+def rate_limit_withdraw(accounts: int):
+    # a single account portfolio has no 401k, so it gets the smallest one that does
+    manager, expenses, start_year = portfolios.build(max(accounts, 2), 1990)
+    group = manager.post_tax_accounts[0]
+    # born 1955, so every year from 2030 on has required minimum distributions
+    years = range(2030, 2060)
+    for year in years:
+        manager.inflate(year)
+
+    def run():
+        for year in years:
+            for month in range(1, 13):
+                group.increase(year, month)
+                group.withdraw(1000.0, year)
+        return len(years) * 12
+
+    return run
+
+
+def calc_income_taxes(accounts: int):
+    manager, expenses, start_year = portfolios.build(accounts, 1990)
+    manager.inflate(2060)
+    incomes = [i * 250.0 for i in range(4000)]
+
+    def run():
+        for _ in range(100):
+            for taxable_income in incomes:
+                manager._calc_income_taxes(taxable_income)
+        # one tax calculation per simulated year
+        return len(incomes) * 100 * 12
+
+    return run
+
+
+def account_increase(accounts: int):
+    manager, expenses, start_year = portfolios.build(accounts, 1990)
+    saving_accounts = _flatten(manager.saving_accounts)
+    states = [acc.snapshot() for acc in saving_accounts]
+    dates = [acc.date for acc in saving_accounts]
+
+    # every account jumps from january 2025 straight to december 2092, from the
+    # same balance every time so it doesn't compound into inf
+    def run():
+        for _ in range(200):
+            for acc, state in zip(saving_accounts, states):
+                acc.restore(state)
+                acc.increase(END_YEAR, 12)
+        return sum(END_YEAR * 12 + 11 - date for date in dates) * 200
+
+    return run
+
+
+def _flatten(accounts: List) -> List:
+    output = []
+    for acc in accounts:
+        output.extend(getattr(acc, "accounts", [acc]))
+    return output
+
+
+CASES = {
+    "sweep": sweep,
+    "run_with_write": run_with_write,
+    "rate_limit_withdraw": rate_limit_withdraw,
+    "calc_income_taxes": calc_income_taxes,
+    "account_increase": account_increase,
+}
@@ -0,0 +1,71 @@
+import account
+import historical_recast
+import income
+import tax_bracket
+from tax_deductions import StandardDeductions
+from yearly_withdraw_manager import Expenses
+from yearly_withdraw_manager import Expense
+from yearly_withdraw_manager import HousingExpense
+from yearly_withdraw_manager import YearlyWithdrawManager
+
+# Synthetic portfolios for the benchmarks. The balance is split evenly over
+# `accounts` accounts cycling through roth, traditional 401k, brokerage and cash,
+# so 1, 10 and 100 accounts do the same amount of spending with more bookkeeping.
+
+START_YEAR = 2025
+BORN_YEAR = 1955
+BALANCE = 2500000.0
+EXPENSES = 100000.0
+
+DEFAULT_SIZES = (1, 10, 100)
+
+
+def build(accounts: int, start_historic_year: int, start_year: int = START_YEAR):
+    market = historical_recast.get_s_p_500_year_rate(start_year, start_historic_year)
+    inflation = historical_recast.get_inflation_year_rate(start_year, start_historic_year)
+    income_tax_brackets = tax_bracket.build_current_income_tax_brackets(inflation)
+    cap_gains_tax_brackets = tax_bracket.build_current_cap_gains_tax_brackets(inflation)
+    standard_deductions = StandardDeductions()
+
+    amount = BALANCE / accounts
+    pre_tax = []
+    traditional = []
+    taxable = []
+    for a in range(accounts):
+        kind = a % 4
+        if kind == 0:
+            acc = account.PreTax401k(f"roth-{a}", amount, start_year, 0.08, start_year, 1)
+            pre_tax.append(acc)
+        elif kind == 1:
+            acc = account.PostTax401k(f"401k-{a}", amount, BORN_YEAR, 0.08, start_year, 1)
+            traditional.append(acc)
+        elif kind == 2:
+            acc = account.TaxableWithBasis(f"brokerage-{a}", amount / 2, amount / 2, 0.08, start_year, 1)
+            taxable.append(acc)
+        else:
+            acc = account.Taxable(f"cash-{a}", amount, 0.02, start_year, 1)
+            taxable.append(acc)
+        if kind != 3:
+            acc.set_inflate_percent_by_year(market)
+
+    post_tax = []
+    if traditional:
+        post_tax.append(account.PostTax401kRateLimit("401ks", traditional, income_tax_brackets, standard_deductions))
+
+    ssi = income.SSI("ssi", 2500, 0.029, 2027, start_year)
+    ssi.set_inflate_percent_by_year(inflation)
+
+    manager = YearlyWithdrawManager(
+        post_tax_accounts=post_tax,
+        pre_tax_accounts=pre_tax,
+        taxable_accounts=taxable,
+        pension_accounts=[ssi],
+        income_tax_brackets=income_tax_brackets,
+        cap_gains_tax_brackets=cap_gains_tax_brackets,
+        standard_deductions=standard_deductions,
+        market_increase_by_year=market,
+        inflation_percent_by_year=inflation)
+    expenses = Expenses([Expense(EXPENSES * 0.8, start_year),
+                         HousingExpense(EXPENSES * 0.2, start_year, start_year + 10)], 0.029)
+    expenses.set_inflate_percent_by_year(inflation)
+    return manager, expenses, start_year
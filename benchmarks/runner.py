@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict
+from typing import Iterable
+from typing import List
+
+from benchmarks import cases
+from benchmarks import portfolios
+
+# Runs the benchmark cases and compares simulated months per second against a
+# saved JSON baseline. Baselines are machine specific, keep them out of git.
+
+BASELINE_FILE = "output/benchmarks.json"
+
+
+def measure(case: cases.Case, accounts: int, repeat: int = 3) -> float:
+    # best of `repeat`, every repeat gets a fresh setup since runs change the accounts
+    best = 0.0
+    for _ in range(repeat):
+        run = case(accounts)
+        start = time.perf_counter()
+        months = run()
+        elapsed = time.perf_counter() - start
+        best = max(best, months / elapsed)
+    return best
+
+
+def run(names: Iterable[str], sizes: Iterable[int], repeat: int = 3) -> Dict[str, float]:
+    output = {}
+    for name in names:
+        for accounts in sizes:
+            output[f"{name}[{accounts}]"] = measure(cases.CASES[name], accounts, repeat)
+    return output
+
+
+def regressions(months_per_second: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    output = []
+    for key, value in months_per_second.items():
+        if key in baseline and value < baseline[key] * (1 - threshold):
+            output.append(key)
+    return output
+
+
+def load_baseline(file_name: str) -> Dict[str, float]:
+    if not os.path.exists(file_name):
+        return {}
+    with open(file_name) as f:
+        return json.load(f)["months_per_second"]
+
+
+def save_baseline(file_name: str, months_per_second: Dict[str, float]):
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    with open(file_name, "w") as f:
+        json.dump({"python": platform.python_version(),
+                   "machine": platform.machine(),
+                   "months_per_second": months_per_second}, f, indent=2, sort_keys=True)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot path in simulated months per second.")
+    parser.add_argument("--case", action="append", choices=sorted(cases.CASES), help="default all cases")
+    parser.add_argument("--accounts", action="append", type=int, help="default 1, 10 and 100")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown that counts as a regression")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    sizes = args.accounts or list(portfolios.DEFAULT_SIZES)
+    baseline = load_baseline(args.baseline)
+    months_per_second = run(args.case or list(cases.CASES), sizes, args.repeat)
+    slower = regressions(months_per_second, baseline, args.threshold)
+
+    for key, value in months_per_second.items():
+        change = f" {(value / baseline[key] - 1) * 100:+.1f}%" if key in baseline else ""
+        flag = " REGRESSION" if key in slower else ""
+        print(f"{key}: {value:,.0f} months/s{change}{flag}")
+
+    if args.save:
+        save_baseline(args.baseline, {**baseline, **months_per_second})
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
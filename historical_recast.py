@@ -1,32 +1,17 @@
-import csv
-import datetime
-from collections import defaultdict
+import rate_table
 
 
-def get_s_p_500_year_rate(start_year: int, historic_year: int, default_rate: float = 0.08):
-    year_to_rate = defaultdict(lambda: default_rate)
-    future_year = start_year
-    with open("s_p_500.csv", "r") as csv_file:
-        reader = csv.reader(csv_file)
-        for row in reader:
-            date_obj = datetime.datetime.strptime(row[0], "%Y-%m-%d").date()
-            if historic_year <= date_obj.year:
-                year_to_rate[future_year] = float(row[1])/100
-                future_year += 1
+def s_p_500_view(start_year: int, historic_year: int, default_rate: float = 0.08) -> rate_table.RateView:
+    return rate_table.load("s_p_500.csv").view(start_year, historic_year, default_rate)
 
-    return year_to_rate
 
+def inflation_view(start_year: int, historic_year: int, default_rate: float = 0.029) -> rate_table.RateView:
+    return rate_table.load("inflation.csv").view(start_year, historic_year, default_rate)
+
+
+def get_s_p_500_year_rate(start_year: int, historic_year: int, default_rate: float = 0.08):
+    return s_p_500_view(start_year, historic_year, default_rate).year_to_rate()
 
-def get_inflation_year_rate(start_year: int, historic_year: int, default_rate: float = 0.029):
-    year_to_rate = defaultdict(lambda: default_rate)
-    future_year = start_year
-    with open("inflation.csv", "r") as csv_file:
-        reader = csv.reader(csv_file)
-        for row in reader:
-            date_obj = datetime.datetime.strptime(row[0], "%Y-%m-%d").date()
-            if historic_year <= date_obj.year:
-                year_to_rate[future_year] = float(row[1])/100
-                future_year += 1
-
-    return year_to_rate
 
+def get_inflation_year_rate(start_year: int, historic_year: int, default_rate: float = 0.029):
+    return inflation_view(start_year, historic_year, default_rate).year_to_rate()
@@ -1,12 +1,24 @@
 from typing import List
+from typing import Optional
+import results
 import tax_bracket
 import account
+import inflation_index
+from ledger import YearLedger
 
 
 class Income(object):
+    __slots__ = ()
+
     def payment(self, year: int) -> float:
         pass
 
+    def yearly_payment(self, year: int) -> float:
+        amount = 0.0
+        for _ in range(12):
+            amount += self.payment(year)
+        return amount
+
     def inflate(self, year: int):
         pass
 
@@ -19,24 +31,39 @@ class Income(object):
     def predicted_yearly_taxable_income(self, year: int) -> float:
         pass
 
+    def projected_payment(self, year: int) -> Optional[float]:
+        # monthly payment in a future year, None when it depends on how the simulation goes
+        return None
+
 
 class FixedPensionIncome(Income):
+    __slots__ = ("name", "monthly_payment", "inflate_percent", "withdrawn_per_year", "min_year", "year",
+                 "inflate_percent_by_year", "base_monthly_payment", "base_year", "inflation_index")
 
     def __init__(self, name: str, monthly_payment: float,
                  inflate_percent: float, min_year: int, start_year: int):
         self.name = name
         self.monthly_payment = monthly_payment
         self.inflate_percent = inflate_percent
-        self.withdrawn_per_year = {}
+        self.withdrawn_per_year = YearLedger()
         self.min_year = min_year
         self.year = start_year
         self.inflate_percent_by_year = {}
+        self.base_monthly_payment = monthly_payment
+        self.base_year = start_year
+        self.inflation_index = inflation_index.get(self.inflate_percent_by_year, inflate_percent)
+
+    def row_header(self) -> List[results.Column]:
+        return [results.Column(self.name, results.MONEY)]
+
+    def row_values(self, year: int) -> List[float]:
+        return [self.withdrawn_per_year.get(year, 0.0)]
 
     def csv_header(self) -> str:
-        return ";" + self.name
+        return results.format_header(self.row_header())
 
     def csv_values(self, year: int) -> str:
-        return f";${self.withdrawn_per_year.get(year, 0.0):,.2f}"
+        return results.format_row(self.row_header(), self.row_values(year))
 
     def payment(self, year: int) -> float:
         if year >= self.min_year:
@@ -44,32 +71,46 @@ class FixedPensionIncome(Income):
             return self.monthly_payment
         return 0
 
+    def yearly_payment(self, year: int) -> float:
+        if year >= self.min_year:
+            amount = self.monthly_payment * 12
+            self.withdrawn_per_year[year] = amount + self.withdrawn_per_year.get(year, 0)
+            return amount
+        return 0
+
     def inflate(self, year: int):
-        while self.year < year:
-            self.monthly_payment *= (1.0 + self._inflate_percent(year))
-            self.year += 1
+        if self.year < year:
+            self.monthly_payment = self.base_monthly_payment * self.inflation_index.ratio(self.base_year, year)
+            self.year = year
 
     def set_inflate_percent_by_year(self, inflate_percent_by_year):
         self.inflate_percent_by_year = inflate_percent_by_year
+        self.inflation_index = inflation_index.get(inflate_percent_by_year, self.inflate_percent)
 
-    def _inflate_percent(self, year):
-        return self.inflate_percent_by_year.get(year, self.inflate_percent)
+    def snapshot(self) -> tuple:
+        return self.monthly_payment, self.year, self.withdrawn_per_year.copy()
+
+    def restore(self, state: tuple):
+        self.monthly_payment, self.year, withdrawn_per_year = state
+        self.withdrawn_per_year = withdrawn_per_year.copy()
 
     def taxable_income(self, year: int) -> float:
         return self.withdrawn_per_year.get(year, 0.0)
 
+    def projected_payment(self, year: int) -> Optional[float]:
+        if year < self.min_year:
+            return 0
+        return self.monthly_payment * self.inflation_index.ratio(self.year, year)
+
     def predicted_yearly_taxable_income(self, year: int) -> float:
         if year < self.min_year:
             return 0
-        future_monthly_payment = self.monthly_payment
-        future_year = self.year
-        while future_year < year:
-            future_year += 1
-            future_monthly_payment *= (1.0 + self._inflate_percent(year))
-        return future_monthly_payment * 12
+        return self.monthly_payment * self.inflation_index.ratio(self.year, year) * 12
 
 
 class SSI(FixedPensionIncome):
+    __slots__ = ()
+
     def __init__(self, name: str, monthly_payment: float,
                  inflate_percent: float, min_year: int, start_year: int):
         super(SSI, self).__init__(name, monthly_payment, inflate_percent, min_year, start_year)
@@ -85,6 +126,8 @@ class SSI(FixedPensionIncome):
 
 
 class PostTax401ksAsPension(Income):
+    __slots__ = ("name", "accounts", "income_tax_brackets", "max_tax_percent", "monthly_payment", "yearly_withdraw")
+
     def __init__(self, accounts: List[account.PostTax401k],
                  income_tax_brackets: tax_bracket.TaxBracketCollection,
                  max_tax_percent: float):
@@ -93,7 +136,7 @@ class PostTax401ksAsPension(Income):
         self.income_tax_brackets = income_tax_brackets
         self.max_tax_percent = max_tax_percent
         self.monthly_payment = 0
-        self.yearly_withdraw = {}
+        self.yearly_withdraw = YearLedger()
 
     def payment(self, year: int) -> float:
         monthly_amount = max(self._max_low_tax_bracket(),
@@ -120,24 +163,30 @@ class PostTax401ksAsPension(Income):
 
         return bracket.max_income
 
-    def csv_header(self) -> str:
-        output = ""
+    def row_header(self) -> List[results.Column]:
+        output = []
         for acc in self.accounts:
-            output += f"{acc.csv_header()}"
+            output.extend(acc.row_header())
 
-        output += f";{self.name}-pay"
-        output += f";rmd"
+        output.append(results.Column(f"{self.name}-pay", results.MONEY))
+        output.append(results.Column("rmd", results.MONEY))
         return output
 
-    def csv_values(self, year: int) -> str:
-        output = ""
+    def row_values(self, year: int) -> List[float]:
+        output = []
         for acc in self.accounts:
-            output += f"{acc.csv_values(year)}"
+            output.extend(acc.row_values(year))
 
-        output += f";${self.yearly_withdraw[year]:,.2f}"
-        output += f";${self.required_yearly_withdraw(year):,.2f}"
+        output.append(self.yearly_withdraw[year])
+        output.append(self.required_yearly_withdraw(year))
         return output
 
+    def csv_header(self) -> str:
+        return results.format_header(self.row_header())
+
+    def csv_values(self, year: int) -> str:
+        return results.format_row(self.row_header(), self.row_values(year))
+
     def inflate(self, year: int):
         self.income_tax_brackets.inflate(year)
 
@@ -145,6 +194,15 @@ class PostTax401ksAsPension(Income):
         for acc in self.accounts:
             acc.increase(year, month)
 
+    def snapshot(self) -> tuple:
+        return self.monthly_payment, self.yearly_withdraw.copy(), [acc.snapshot() for acc in self.accounts]
+
+    def restore(self, state: tuple):
+        self.monthly_payment, yearly_withdraw, account_states = state
+        self.yearly_withdraw = yearly_withdraw.copy()
+        for acc, account_state in zip(self.accounts, account_states):
+            acc.restore(account_state)
+
     def taxable_income(self, year: int) -> float:
         total = 0
         for acc in self.accounts:
@@ -0,0 +1,64 @@
+import array
+from collections import OrderedDict
+from typing import Dict
+
+# Cumulative inflation per rate path. factor(year) is the product of (1 + rate(y))
+# for every year after FIRST_YEAR up to and including year, so inflating a value
+# from one year to another is one ratio instead of a loop over the years between.
+# Each year uses its own rate. Everything inflating on the same rates shares one
+# index through get().
+
+FIRST_YEAR = 1900
+
+
+class InflationIndex(object):
+    __slots__ = ("rates", "default_rate", "factors")
+
+    def __init__(self, rates: Dict[int, float], default_rate: float):
+        self.rates = rates
+        self.default_rate = default_rate
+        self.factors = array.array("d", [1.0])
+
+    def factor(self, year: int) -> float:
+        index = year - FIRST_YEAR
+        if index < 0:
+            raise ValueError(f"no inflation index before {FIRST_YEAR}: {year}")
+        factors = self.factors
+        if index >= len(factors):
+            rates = self.rates
+            default_rate = self.default_rate
+            factor = factors[-1]
+            for y in range(FIRST_YEAR + len(factors), year + 1):
+                factor *= 1.0 + rates.get(y, default_rate)
+                factors.append(factor)
+        return factors[index]
+
+    def ratio(self, from_year: int, to_year: int) -> float:
+        return self.factor(to_year) / self.factor(from_year)
+
+
+_MAX_INDEXES = 4096
+_indexes = OrderedDict()
+
+
+def get(rates: Dict[int, float], default_rate: float = None) -> InflationIndex:
+    """
+    The index of a rate dict, with default_rate for years it has no rate for.
+    The default of a defaultdict or RateView is used when default_rate is None.
+    """
+    if default_rate is None:
+        default_factory = getattr(rates, "default_factory", None)
+        default_rate = default_factory() if default_factory else getattr(rates, "default_rate", 0.0)
+
+    # keyed by id, the cache holds on to the rates so the id can't be reused
+    key = (id(rates), default_rate)
+    found = _indexes.get(key)
+    if found is not None and found.rates is rates:
+        _indexes.move_to_end(key)
+        return found
+
+    index = InflationIndex(rates, default_rate)
+    _indexes[key] = index
+    if len(_indexes) > _MAX_INDEXES:
+        _indexes.popitem(last=False)
+    return index
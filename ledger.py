@@ -0,0 +1,124 @@
+import array
+import math
+from typing import Any
+from typing import Iterator
+from typing import Tuple
+
+# Per-year bookkeeping over a contiguous range of years, indexed by year - first_year
+# instead of hashing every year into a dict. Reads like the int keyed dicts it replaces:
+# get(year, default), year in ledger, ledger[year], ledger[year] = value.
+# A LinkedLedger also keeps a running total shared with other ledgers, so the sum
+# over all of them for a year is one lookup instead of a scan.
+
+
+class YearLedger(object):
+    """
+    Amounts per year stored in an array('d'). Years that were never set hold nan.
+    """
+    __slots__ = ("first_year", "values")
+
+    def __init__(self, first_year: int = 0, values: array.array = None):
+        self.first_year = first_year
+        self.values = array.array("d") if values is None else values
+
+    def get(self, year: int, default: float = None) -> float:
+        index = year - self.first_year
+        if 0 <= index < len(self.values):
+            value = self.values[index]
+            if value == value:
+                return value
+        return default
+
+    def __contains__(self, year: int) -> bool:
+        return self.get(year) is not None
+
+    def __getitem__(self, year: int) -> float:
+        value = self.get(year)
+        if value is None:
+            raise KeyError(year)
+        return value
+
+    def __setitem__(self, year: int, value: float):
+        index = year - self.first_year
+        if not 0 <= index < len(self.values):
+            index = self._grow(year)
+        self.values[index] = value
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __iter__(self) -> Iterator[int]:
+        return (year for year, _ in self.items())
+
+    def items(self) -> Iterator[Tuple[int, Any]]:
+        first_year = self.first_year
+        return ((first_year + i, value) for i, value in enumerate(self.values) if self._is_set(value))
+
+    def copy(self) -> "YearLedger":
+        return self.__class__(self.first_year, self.values[:])
+
+    def _grow(self, year: int) -> int:
+        if not self.values:
+            self.first_year = year
+            self.values.extend(self._unset(1))
+        elif year < self.first_year:
+            self.values[0:0] = self._unset(self.first_year - year)
+            self.first_year = year
+        else:
+            self.values.extend(self._unset(year - self.first_year - len(self.values) + 1))
+        return year - self.first_year
+
+    @staticmethod
+    def _is_set(value) -> bool:
+        return value == value
+
+    @staticmethod
+    def _unset(count: int) -> array.array:
+        return array.array("d", [math.nan]) * count
+
+
+class LinkedLedger(YearLedger):
+    """
+    A YearLedger that adds every change of a year's amount to the same year of total.
+    """
+    __slots__ = ("total",)
+
+    def __init__(self, total: YearLedger, first_year: int = 0, values: array.array = None):
+        super().__init__(first_year, values)
+        self.total = total
+
+    def __setitem__(self, year: int, value: float):
+        change = value - self.get(year, 0.0)
+        if change:
+            total = self.total
+            total[year] = total.get(year, 0.0) + change
+        super().__setitem__(year, value)
+
+    def copy(self) -> "LinkedLedger":
+        return self.__class__(self.total, self.first_year, self.values[:])
+
+
+class YearTable(YearLedger):
+    """
+    Objects per year stored in a list. Years that were never set hold None.
+    """
+    __slots__ = ()
+
+    def __init__(self, first_year: int = 0, values: list = None):
+        super().__init__(first_year, [] if values is None else values)
+
+    def get(self, year: int, default: Any = None) -> Any:
+        index = year - self.first_year
+        if 0 <= index < len(self.values):
+            value = self.values[index]
+            if value is not None:
+                return value
+        return default
+
+    @staticmethod
+    def _is_set(value) -> bool:
+        return value is not None
+
+    @staticmethod
+    def _unset(count: int) -> list:
+        return [None] * count
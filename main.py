@@ -1,25 +1,25 @@
+from typing import List
+
 from yearly_withdraw_manager import YearlyWithdrawManager
-from yearly_withdraw_manager import YearlyTaxes
+from simulation import END_YEAR
+from simulation import Simulation
+import results
 import scenarios
+import sweep
 
 
-def print_year(year: int, expenses: float, manager: YearlyWithdrawManager, f):
-    f.write(f'{str(year)};{year - 1977};${expenses:,.2f}{manager.csv(year)}\n')
+def year_header(manager: YearlyWithdrawManager) -> List[results.Column]:
+    return [results.Column("year", results.NUMBER),
+            results.Column("age", results.NUMBER),
+            results.Column("income", results.MONEY)] + manager.row_header()
 
 
-def print_header(manager: YearlyWithdrawManager, f):
-    f.write(f"year;age;income{manager.csv_header()}\n")
+def year_values(year: int, expenses: float, manager: YearlyWithdrawManager) -> List[float]:
+    return [year, year - 1977, expenses] + manager.row_values(year)
 
 
 def run():
-    # count = 0
-    # total = 0
-    # for year in range(1960, 2025):
-    #     if run_with_year(year):
-    #         count += 1
-    #     total += 1
-    #
-    # print(f"success {count}/{total} {count/total * 100:.1f}%")
+    # print(sweep.sweep(scenarios.inorder_rate_limit).summary())
 
     run_with_write(2025)
 
@@ -27,68 +27,18 @@ def run():
 def run_with_year(start_historic_year):
     manager, expenses, start_year = scenarios.inorder_rate_limit(start_historic_year)
 
-    end_year = 2092
-
-    taxes = 0.0
-    for year in range(start_year, end_year + 1):
-        expenses.inflate(year)
-        manager.inflate(year)
-        manager.set_total_predicted_income_taxes(year)
-        # jan 1st
-        yearly_income = expenses.amount(year)
-        manager.pay_taxes(taxes, year)
-        for month in range(1, 13):
-            monthly_income = yearly_income / 12
-            manager.increase(year, month)
-            pension = manager.monthly_pension(year)
-            monthly_income -= pension
-            if monthly_income < 0:
-                return False
-            monthly_left_over = manager.withdraw(monthly_income, year)
-            if monthly_left_over > 0:
-                return False
-
-        manager.conversions(year)
-        manager.lump_sum_payments(year)
-        taxes = manager.taxes(year).total()
-
-    return True
-
-
-def run_with_write(start_historic_year):
+    return Simulation(manager, expenses, start_year, END_YEAR).run()
+
+
+def run_with_write(start_historic_year, sink: results.ResultSink = None):
     manager, expenses, start_year = scenarios.inorder_rate_limit(start_historic_year)
+    simulation = Simulation(manager, expenses, start_year, END_YEAR)
+
+    with sink or results.CsvSink("output/output.csv", human=True) as sink:
+        sink.open(year_header(manager))
+        if not simulation.run(on_year=lambda year: sink.write(year_values(year, expenses.amount(year), manager))):
+            print(simulation.failure_message)
+
 
-    end_year = 2092
-
-    taxes = 0.0
-    with open("output/output.csv", "w") as f:
-        print_header(manager, f)
-        for year in range(start_year, end_year + 1):
-            expenses.inflate(year)
-            manager.inflate(year)
-            manager.set_total_predicted_income_taxes(year)
-            # jan 1st
-            yearly_income = expenses.amount(year)
-            manager.pay_taxes(taxes, year)
-            for month in range(1, 13):
-                monthly_income = yearly_income / 12
-                manager.increase(year, month)
-                pension = manager.monthly_pension(year)
-                monthly_income -= pension
-                if monthly_income < 0:
-                    print(f"pension payment is more than needed income {pension:,.2f}")
-                    return
-                monthly_left_over = manager.withdraw(monthly_income, year)
-                if monthly_left_over > 0:
-                    print(f'out of money year {year} {monthly_left_over}')
-                    return
-
-            manager.conversions(year)
-            manager.lump_sum_payments(year)
-            taxes = manager.taxes(year).total()
-
-            # Dec 31st
-            print_year(year, expenses.amount(year), manager, f)
-
-
-run()
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,180 @@
+import argparse
+import math
+from collections import defaultdict
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+import rate_table
+import scenario_file
+from simulation import END_YEAR
+from sweep import load_scenario
+from vectorized import VectorizedSimulation
+
+# Monte Carlo driver. Paths are built by a block bootstrap over paired
+# (S&P return, inflation) calendar years so that runs of good and bad years
+# keep their autocorrelation. Scenarios for it are path factories:
+#   factory(market_by_year, inflation_by_year) -> (manager, expenses, start_year)
+# i.e. the same thing a start year factory builds, but with the rates passed in
+# instead of read through historical_recast.
+# Asset classes a scenario file reads from csv files are bootstrapped together with
+# them, from the same calendar years, and passed to on_path as asset_rates.
+
+START_YEAR = 2025
+
+
+def load_history(files: Sequence[str]) -> Tuple[List[int], List[np.ndarray]]:
+    """
+    The rates of every file over the calendar years all of them have.
+    """
+    tables = [rate_table.load(file_name) for file_name in files]
+    years = list(range(max(table.first_year for table in tables), min(table.last_year for table in tables) + 1))
+    return years, [np.array([table.rate(y) for y in years]) for table in tables]
+
+
+def load_paired_history(s_p_500_file: str = "s_p_500.csv",
+                        inflation_file: str = "inflation.csv") -> Tuple[List[int], np.ndarray, np.ndarray]:
+    years, (market, inflation) = load_history([s_p_500_file, inflation_file])
+    return years, market, inflation
+
+
+class BlockBootstrap(object):
+    """
+    asset_classes are more rates by name, over the same calendar years as market and inflation.
+    """
+
+    def __init__(self, market: np.ndarray, inflation: np.ndarray, block_length: int = 5,
+                 asset_classes: Dict[str, np.ndarray] = None):
+        if block_length < 1:
+            raise ValueError(f"block_length must be at least 1: {block_length}")
+        self.market = market
+        self.inflation = inflation
+        self.block_length = block_length
+        self.asset_classes = asset_classes or {}
+        for name, rates in self.asset_classes.items():
+            if len(rates) != len(market):
+                raise ValueError(f"asset class {name} has {len(rates)} years of rates, market has {len(market)}")
+
+    def sample(self, rng: np.random.Generator, count: int,
+               length: int) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        # circular blocks, so the last years of history are as likely to be drawn as the first
+        blocks = -(-length // self.block_length)
+        starts = rng.integers(0, len(self.market), size=(count, blocks))
+        offsets = np.arange(self.block_length)
+        index = (starts[:, :, None] + offsets) % len(self.market)
+        index = index.reshape(count, blocks * self.block_length)[:, :length]
+        return self.market[index], self.inflation[index], {name: rates[index]
+                                                           for name, rates in self.asset_classes.items()}
+
+
+class MonteCarloResult(object):
+    def __init__(self, paths: int, successes: int, failure_years: Dict[int, int]):
+        self.paths = paths
+        self.successes = successes
+        self.failure_years = failure_years
+
+    def success_probability(self) -> float:
+        return self.successes / self.paths if self.paths else 0.0
+
+    def confidence_interval(self, z: float = 1.96) -> Tuple[float, float]:
+        # Wilson score interval, well behaved near 0% and 100%
+        if not self.paths:
+            return 0.0, 1.0
+        p = self.success_probability()
+        n = self.paths
+        center = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        return max(center - half, 0.0), min(center + half, 1.0)
+
+    def summary(self) -> str:
+        low, high = self.confidence_interval()
+        output = ""
+        for year in sorted(self.failure_years):
+            output += f"{year}: {self.failure_years[year]} failed\n"
+        output += f"success {self.successes}/{self.paths} {self.success_probability() * 100:.1f}% " \
+                  f"(95% {low * 100:.1f}%-{high * 100:.1f}%)"
+        return output
+
+
+def _rates(values: np.ndarray, start_year: int, default_rate: float) -> Dict[int, float]:
+    year_to_rate = defaultdict(lambda: default_rate)
+    year_to_rate.update(zip(range(start_year, start_year + len(values)), values.tolist()))
+    return year_to_rate
+
+
+def run(path_scenario: Callable,
+        paths: int = 10000,
+        seed: int = 0,
+        batch_size: int = 2000,
+        block_length: int = 5,
+        start_year: int = START_YEAR,
+        end_year: int = END_YEAR,
+        bootstrap: BlockBootstrap = None,
+        asset_classes: Sequence[Tuple[str, str, float]] = None) -> MonteCarloResult:
+    """
+    Simulate `paths` bootstrapped rate paths, at most batch_size at a time.
+    Paths only depend on seed, never on batch_size. asset_classes are the
+    (name, file_name, default_rate) passed to path_scenario as asset_rates, by
+    default those of the scenario file path_scenario is the on_path of.
+    """
+    if asset_classes is None:
+        template = getattr(path_scenario, "__self__", None)
+        asset_classes = template.file_asset_classes() if isinstance(template, scenario_file.ScenarioTemplate) else []
+    if bootstrap is None:
+        _, rates = load_history(["s_p_500.csv", "inflation.csv"] + [file_name for _, file_name, _ in asset_classes])
+        bootstrap = BlockBootstrap(rates[0], rates[1], block_length,
+                                   {name: class_rates for (name, _, _), class_rates in zip(asset_classes, rates[2:])})
+    missing = [name for name, _, _ in asset_classes if name not in bootstrap.asset_classes]
+    if missing:
+        raise ValueError(f"the bootstrap has no rates for asset classes {', '.join(missing)}")
+
+    rng = np.random.default_rng(seed)
+    length = end_year - start_year + 1
+    successes = 0
+    failure_years = {}
+    done = 0
+    while done < paths:
+        count = min(batch_size, paths - done)
+        market, inflation, class_rates = bootstrap.sample(rng, count, length)
+        scenarios = []
+        for p in range(count):
+            rates = (_rates(market[p], start_year, 0.08), _rates(inflation[p], start_year, 0.029))
+            if asset_classes:
+                asset_rates = {name: _rates(class_rates[name][p], start_year, default_rate)
+                               for name, _, default_rate in asset_classes}
+                scenarios.append(path_scenario(*rates, asset_rates=asset_rates))
+            else:
+                scenarios.append(path_scenario(*rates))
+        simulation = VectorizedSimulation(scenarios, end_year)
+        failed = simulation.run()
+        successes += int((failed == 0).sum())
+        for year, failures in zip(*np.unique(failed[failed != 0], return_counts=True)):
+            failure_years[int(year)] = failure_years.get(int(year), 0) + int(failures)
+        done += count
+
+    return MonteCarloResult(paths, successes, failure_years)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Monte Carlo success probability from bootstrapped history.")
+    parser.add_argument("--scenario", default="scenario_files/example.toml:on_path",
+                        help="module:function taking (market_by_year, inflation_by_year), or file.toml:on_path")
+    parser.add_argument("--paths", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--block-length", type=int, default=5)
+    parser.add_argument("--start-year", type=int, default=START_YEAR)
+    parser.add_argument("--end-year", type=int, default=END_YEAR)
+    args = parser.parse_args(argv)
+
+    result = run(load_scenario(args.scenario), args.paths, args.seed, args.batch_size, args.block_length,
+                 args.start_year, args.end_year)
+    print(result.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import argparse
+import functools
+import itertools
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import account
+from simulation import END_YEAR
+from simulation import Simulation
+from sweep import FIRST_HISTORIC_YEAR
+from sweep import LAST_HISTORIC_YEAR
+from sweep import load_scenario
+
+# Grid search over the conversion and bracket filling knobs of a scenario:
+#   conversion_tax_percent  YearlyWithdrawManager, convert up to the top of this bracket
+#   max_tax_percent         PostTax401kRateLimit, fill 401k withdrawals up to this bracket
+#   percent_over_max        PostTax401kRateLimit, and this much above it
+# Every (params, start year) is simulated at most once. Start years are simulated in
+# rounds, and when maximizing success, a setting is dropped once it can no longer
+# reach the success count another setting already has.
+
+Params = namedtuple("Params", ["conversion_tax_percent", "max_tax_percent", "percent_over_max"])
+
+CONVERSION_TAX_PERCENTS = [0.0, 0.10, 0.12, 0.22]
+MAX_TAX_PERCENTS = [0.10, 0.12, 0.15, 0.22, 0.24]
+PERCENTS_OVER_MAX = [0.0, 0.15, 0.3, 0.6]
+
+SUCCESS = "success"
+WEALTH = "wealth"
+
+# flat rates for valuing what is left at the end after taxes
+TRADITIONAL_TAX = 0.22
+CAP_GAINS_TAX = 0.15
+
+
+def grid(conversion_tax_percents: Iterable[float] = CONVERSION_TAX_PERCENTS,
+         max_tax_percents: Iterable[float] = MAX_TAX_PERCENTS,
+         percents_over_max: Iterable[float] = PERCENTS_OVER_MAX) -> List[Params]:
+    candidates = [Params(*p) for p in itertools.product(conversion_tax_percents, max_tax_percents, percents_over_max)]
+    if not candidates:
+        raise ValueError("empty parameter grid")
+    return candidates
+
+
+def apply(params: Params, manager):
+    manager.conversion_tax_percent = params.conversion_tax_percent
+    for acc in manager.post_tax_accounts:
+        if isinstance(acc, account.PostTax401kRateLimit):
+            acc.max_tax_percent = params.max_tax_percent
+            acc.percent_over_max = params.percent_over_max
+
+
+def after_tax_wealth(manager) -> float:
+    amount = 0.0
+    for acc in manager.saving_accounts:
+        for sub in getattr(acc, "accounts", [acc]):
+            if isinstance(sub, account.TaxableWithBasis):
+                amount += sub.amount_basis + sub.amount_gains * (1 - CAP_GAINS_TAX)
+            elif isinstance(sub, account.PostTax401k):
+                amount += sub.amount * (1 - TRADITIONAL_TAX)
+            else:
+                amount += sub.amount
+    return amount
+
+
+def evaluate(scenario: Callable, end_year: int, task: Tuple[Params, int]) -> Tuple[bool, float]:
+    params, start_historic_year = task
+    manager, expenses, start_year = scenario(start_historic_year)
+    apply(params, manager)
+    simulation = Simulation(manager, expenses, start_year, end_year)
+    if not simulation.run():
+        return False, 0.0
+    return True, after_tax_wealth(manager)
+
+
+class Evaluation(object):
+    def __init__(self, params: Params, outcomes: Dict[int, Tuple[bool, float]], years: int):
+        self.params = params
+        self.outcomes = outcomes
+        self.years = years
+
+    @property
+    def complete(self) -> bool:
+        return len(self.outcomes) == self.years
+
+    @property
+    def successes(self) -> int:
+        return sum(1 for success, _ in self.outcomes.values() if success)
+
+    def success_rate(self) -> float:
+        return self.successes / len(self.outcomes) if self.outcomes else 0.0
+
+    def mean_wealth(self) -> float:
+        return sum(wealth for _, wealth in self.outcomes.values()) / len(self.outcomes) if self.outcomes else 0.0
+
+    def key(self, objective: str) -> Tuple[float, float]:
+        if objective == WEALTH:
+            return self.mean_wealth(), self.success_rate()
+        return self.success_rate(), self.mean_wealth()
+
+
+class OptimizerResult(object):
+    def __init__(self, evaluations: List[Evaluation], objective: str, simulations: int):
+        self.evaluations = evaluations
+        self.objective = objective
+        self.simulations = simulations
+
+    def ranked(self) -> List[Evaluation]:
+        complete = [e for e in self.evaluations if e.complete]
+        return sorted(complete, key=lambda e: e.key(self.objective), reverse=True)
+
+    def best(self) -> Optional[Evaluation]:
+        ranked = self.ranked()
+        return ranked[0] if ranked else None
+
+    def summary(self, top: int = 10) -> str:
+        output = "conversion_tax_percent max_tax_percent percent_over_max success after_tax_wealth\n"
+        for e in self.ranked()[:top]:
+            p = e.params
+            output += f"{p.conversion_tax_percent * 100:.0f}% {p.max_tax_percent * 100:.0f}% " \
+                      f"{p.percent_over_max * 100:.0f}% {e.success_rate() * 100:.1f}% ${e.mean_wealth():,.2f}\n"
+        pruned = sum(1 for e in self.evaluations if not e.complete)
+        output += f"{len(self.evaluations)} settings, {pruned} pruned, {self.simulations} simulations"
+        return output
+
+
+class GridSearch(object):
+    """
+    Keeps every (params, start year) outcome, so searching again with a finer or
+    overlapping grid only simulates what is new.
+    """
+
+    def __init__(self, scenario: Callable,
+                 start_historic_years: Iterable[int] = range(FIRST_HISTORIC_YEAR, LAST_HISTORIC_YEAR + 1),
+                 end_year: int = END_YEAR,
+                 max_workers: Optional[int] = None,
+                 round_years: int = 8):
+        self.scenario = scenario
+        self.years = list(start_historic_years)
+        self.end_year = end_year
+        self.max_workers = max_workers
+        self.round_years = round_years
+        self.cache: Dict[Tuple[Params, int], Tuple[bool, float]] = {}
+        self.simulations = 0
+
+    def search(self, candidates: List[Params], objective: str = SUCCESS) -> OptimizerResult:
+        if not candidates:
+            raise ValueError("empty parameter grid")
+        simulations = self.simulations
+        if self.max_workers == 1:
+            self._search(candidates, objective, map)
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                self._search(candidates, objective, functools.partial(executor.map, chunksize=4))
+
+        evaluations = [Evaluation(p, self._outcomes(p), len(self.years)) for p in candidates]
+        return OptimizerResult(evaluations, objective, self.simulations - simulations)
+
+    def _search(self, candidates: List[Params], objective: str, map_function):
+        # the first setting runs every year, its failures go first so weak settings show early
+        self._run([(candidates[0], year) for year in self.years], map_function)
+        first = self._outcomes(candidates[0])
+        years = sorted(self.years, key=lambda year: first[year][0])
+
+        alive = list(candidates)
+        done = 0
+        # terminal wealth has no bound to prune on, every setting runs every year
+        while objective == SUCCESS and done < len(years) and len(alive) > 1:
+            rounds = years[done:done + self.round_years]
+            self._run([(p, year) for p in alive for year in rounds], map_function)
+            done += len(rounds)
+
+            # prune settings that can't reach the best success count even if every remaining year survives
+            successes = {p: sum(1 for year in years[:done] if self.cache[(p, year)][0]) for p in alive}
+            best = max(successes.values())
+            alive = [p for p in alive if successes[p] + len(years) - done >= best]
+
+        self._run([(p, year) for p in alive for year in years[done:]], map_function)
+
+    def _run(self, tasks: List[Tuple[Params, int]], map_function):
+        tasks = [task for task in tasks if task not in self.cache]
+        run = functools.partial(evaluate, self.scenario, self.end_year)
+        for task, outcome in zip(tasks, map_function(run, tasks)):
+            self.cache[task] = outcome
+        self.simulations += len(tasks)
+
+    def _outcomes(self, params: Params) -> Dict[int, Tuple[bool, float]]:
+        return {year: self.cache[(params, year)] for year in self.years if (params, year) in self.cache}
+
+
+def optimize(scenario: Callable,
+             candidates: List[Params] = None,
+             objective: str = SUCCESS,
+             start_historic_years: Iterable[int] = range(FIRST_HISTORIC_YEAR, LAST_HISTORIC_YEAR + 1),
+             end_year: int = END_YEAR,
+             max_workers: Optional[int] = None) -> OptimizerResult:
+    search = GridSearch(scenario, start_historic_years, end_year, max_workers)
+    return search.search(candidates or grid(), objective)
+
+
+def _floats(text: str) -> List[float]:
+    return [float(value) for value in text.split(",")]
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Grid search conversion and 401k bracket filling settings.")
+    parser.add_argument("--scenario", default="scenario_files/example.toml")
+    parser.add_argument("--objective", choices=[SUCCESS, WEALTH], default=SUCCESS)
+    parser.add_argument("--conversion-tax-percents", type=_floats, default=CONVERSION_TAX_PERCENTS)
+    parser.add_argument("--max-tax-percents", type=_floats, default=MAX_TAX_PERCENTS)
+    parser.add_argument("--percents-over-max", type=_floats, default=PERCENTS_OVER_MAX)
+    parser.add_argument("--first-year", type=int, default=FIRST_HISTORIC_YEAR)
+    parser.add_argument("--last-year", type=int, default=LAST_HISTORIC_YEAR)
+    parser.add_argument("--end-year", type=int, default=END_YEAR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    candidates = grid(args.conversion_tax_percents, args.max_tax_percents, args.percents_over_max)
+    result = optimize(load_scenario(args.scenario), candidates, args.objective,
+                      range(args.first_year, args.last_year + 1), args.end_year, args.workers)
+    print(result.summary(args.top))
+
+
+if __name__ == "__main__":
+    main()
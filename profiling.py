@@ -0,0 +1,140 @@
+import contextlib
+import time
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+# Optional instrumentation of the yearly loop. Nothing in the simulation knows
+# about it: while attached, the manager, expenses, accounts and pensions of a
+# Simulation are replaced by proxies that time every method call, and the
+# originals are put back afterwards. Without a profiler attached the loop
+# runs exactly the code it always did.
+#
+# Calls are recorded per call stack, e.g. ("withdraw", "PostTax401kRateLimit.withdraw",
+# "PostTax401k.withdraw"). Top level names are the Simulation phases (the
+# manager methods it calls), nested names are "<class>.<method>".
+
+Stack = Tuple[str, ...]
+
+
+class Profiler(object):
+    def __init__(self):
+        # stack -> [calls, seconds, seconds spent in nested calls]
+        self.stats: Dict[Stack, List[float]] = {}
+        self._stack = []
+
+    def call(self, name: str, function, *args, **kwargs):
+        stack = self._stack
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stat = self._stat(tuple(stack))
+            stat[0] += 1
+            stat[1] += elapsed
+            stack.pop()
+            if stack:
+                self._stat(tuple(stack))[2] += elapsed
+
+    def _stat(self, stack: Stack) -> List[float]:
+        stat = self.stats.get(stack)
+        if stat is None:
+            stat = self.stats[stack] = [0, 0.0, 0.0]
+        return stat
+
+    def merge(self, stats: Dict[Stack, List[float]]):
+        for stack, (calls, seconds, nested) in stats.items():
+            stat = self._stat(stack)
+            stat[0] += calls
+            stat[1] += seconds
+            stat[2] += nested
+
+    def phases(self) -> Dict[str, Tuple[int, float]]:
+        """
+        Calls and wall time of every Simulation phase, nested calls included.
+        """
+        return {stack[0]: (int(calls), seconds)
+                for stack, (calls, seconds, _) in self.stats.items() if len(stack) == 1}
+
+    def classes(self) -> Dict[str, Tuple[int, float]]:
+        """
+        Calls and wall time per account, income and expenses class. Time spent in
+        nested calls is counted for the callee, so the classes add up without overlap.
+        """
+        output = {}
+        for stack, (calls, seconds, nested) in self.stats.items():
+            if len(stack) == 1:
+                continue
+            name = stack[-1].partition(".")[0]
+            total_calls, total_seconds = output.get(name, (0, 0.0))
+            output[name] = (total_calls + int(calls), total_seconds + seconds - nested)
+        return output
+
+    def summary(self) -> str:
+        output = "phase calls seconds\n"
+        for name, (calls, seconds) in sorted(self.phases().items(), key=lambda item: -item[1][1]):
+            output += f"{name} {calls:,} {seconds:.3f}\n"
+        output += "class calls seconds\n"
+        for name, (calls, seconds) in sorted(self.classes().items(), key=lambda item: -item[1][1]):
+            output += f"{name} {calls:,} {seconds:.3f}\n"
+        return output[:-1]
+
+    def folded_stacks(self) -> str:
+        """
+        Self time per stack in microseconds, in the folded format flamegraph.pl
+        and speedscope read.
+        """
+        output = ""
+        for stack, (_, seconds, nested) in sorted(self.stats.items()):
+            output += f"{';'.join(stack)} {int(round((seconds - nested) * 1e6))}\n"
+        return output
+
+    @contextlib.contextmanager
+    def attach(self, simulation):
+        saved = []
+
+        def swap(obj, attr, value):
+            saved.append((obj, attr, getattr(obj, attr)))
+            setattr(obj, attr, value)
+
+        manager = simulation.manager
+        for attr in ("taxable_accounts", "post_tax_accounts", "pre_tax_accounts", "pension_accounts"):
+            accounts = getattr(manager, attr)
+            for acc in accounts:
+                # account groups and 401ks as pension hand work on to their own accounts
+                if hasattr(acc, "accounts"):
+                    swap(acc, "accounts", [_Timed(self, sub, type(sub).__name__) for sub in acc.accounts])
+            swap(manager, attr, [_Timed(self, acc, type(acc).__name__) for acc in accounts])
+        swap(manager, "saving_accounts", manager.taxable_accounts + manager.post_tax_accounts + manager.pre_tax_accounts)
+        swap(simulation, "expenses", _Timed(self, simulation.expenses, type(simulation.expenses).__name__))
+        swap(simulation, "manager", _Timed(self, manager, None))
+        try:
+            yield self
+        finally:
+            for obj, attr, value in reversed(saved):
+                setattr(obj, attr, value)
+
+
+class _Timed(object):
+    __slots__ = ("_profiler", "_target", "_prefix")
+
+    def __init__(self, profiler: Profiler, target, prefix: str = None):
+        object.__setattr__(self, "_profiler", profiler)
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_prefix", prefix)
+
+    def __getattr__(self, name: str):
+        value = getattr(self._target, name)
+        if not callable(value):
+            return value
+        profiler = self._profiler
+        label = name if self._prefix is None else f"{self._prefix}.{name}"
+
+        def timed(*args, **kwargs):
+            return profiler.call(label, value, *args, **kwargs)
+        return timed
+
+    def __setattr__(self, name: str, value):
+        setattr(self._target, name, value)
@@ -0,0 +1,124 @@
+import array
+import csv
+import datetime
+import functools
+import os
+import tempfile
+from collections import defaultdict
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+# Set to a directory to keep preparsed binary copies of the rate csv files there.
+# The copy is used as long as it is newer than the csv it was made from.
+cache_dir = None
+
+
+class RateTable(object):
+    def __init__(self, first_year: int, rates: array.array):
+        self.first_year = first_year
+        self.rates = rates
+
+    @property
+    def last_year(self) -> int:
+        return self.first_year + len(self.rates) - 1
+
+    def rate(self, year: int) -> Optional[float]:
+        index = year - self.first_year
+        if 0 <= index < len(self.rates):
+            return self.rates[index]
+        return None
+
+    def view(self, start_year: int, historic_year: int, default_rate: float) -> "RateView":
+        return RateView(self, start_year, historic_year, default_rate)
+
+    @classmethod
+    def parse_csv(cls, file_name: str) -> "RateTable":
+        first_year = None
+        rates = array.array("d")
+        with open(file_name, "r") as csv_file:
+            reader = csv.reader(csv_file)
+            for row in reader:
+                year = datetime.datetime.strptime(row[0], "%Y-%m-%d").year
+                if first_year is None:
+                    first_year = year
+                elif year != first_year + len(rates):
+                    raise ValueError(f"{file_name}: expected a row for {first_year + len(rates)} not {year}")
+                rates.append(float(row[1]) / 100)
+
+        if first_year is None:
+            raise ValueError(f"{file_name}: no rates")
+        return cls(first_year, rates)
+
+
+class RateView(object):
+    """
+    Rates of a table replayed from historic_year onwards as if they started in start_year.
+    Behaves like the defaultdicts historical_recast returns, without copying the rates.
+    """
+
+    def __init__(self, table: RateTable, start_year: int, historic_year: int, default_rate: float):
+        self.table = table
+        self.start_year = start_year
+        self.default_rate = default_rate
+        self._offset = max(historic_year - table.first_year, 0)
+        self._length = max(len(table.rates) - self._offset, 0)
+
+    def __getitem__(self, year: int) -> float:
+        return self.get(year, self.default_rate)
+
+    def __contains__(self, year: int) -> bool:
+        return 0 <= year - self.start_year < self._length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.start_year, self.start_year + self._length))
+
+    def get(self, year: int, default: float = None) -> float:
+        index = year - self.start_year
+        if 0 <= index < self._length:
+            return self.table.rates[self._offset + index]
+        return default
+
+    def items(self) -> Iterator[Tuple[int, float]]:
+        return zip(self, self.table.rates[self._offset:])
+
+    def year_to_rate(self) -> Dict[int, float]:
+        default_rate = self.default_rate
+        year_to_rate = defaultdict(lambda: default_rate)
+        year_to_rate.update(self.items())
+        return year_to_rate
+
+
+def load(file_name: str) -> RateTable:
+    return _load(os.path.abspath(file_name), cache_dir)
+
+
+@functools.lru_cache(maxsize=None)
+def _load(path: str, directory: Optional[str]) -> RateTable:
+    if directory is None:
+        return RateTable.parse_csv(path)
+
+    cache_file = os.path.join(directory, os.path.basename(path) + ".bin")
+    if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(path):
+        values = array.array("d")
+        with open(cache_file, "rb") as f:
+            values.frombytes(f.read())
+        return RateTable(int(values[0]), values[1:])
+
+    table = RateTable.parse_csv(path)
+    os.makedirs(directory, exist_ok=True)
+    # written next to it and renamed into place, a concurrent reader sees the whole file or none
+    fd, temp_file = tempfile.mkstemp(dir=directory, prefix=os.path.basename(cache_file) + ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            array.array("d", [table.first_year]).tofile(f)
+            table.rates.tofile(f)
+        os.replace(temp_file, cache_file)
+    except BaseException:
+        os.unlink(temp_file)
+        raise
+    return table
@@ -0,0 +1,218 @@
+import argparse
+import array
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import historical_recast
+import rate_table
+import results
+import scenario_file
+from simulation import END_YEAR
+from simulation import Simulation
+from simulation import SimulationResult
+from sweep import FIRST_HISTORIC_YEAR
+from sweep import LAST_HISTORIC_YEAR
+from sweep import SweepResult
+
+# On disk cache of simulation results, one SQLite file under output/. A run is keyed by
+# a hash of the compiled scenario, the start year, the options, the market, inflation and
+# asset class rates it is simulated on and ENGINE_VERSION, so a changed scenario or rate
+# file only misses for the runs it changes. Entries are the per-year rows and the outcome, and the
+# least recently used ones are dropped once the file holds more than max_bytes.
+# Only scenario files (ScenarioTemplate) can be cached, a Python scenario function has
+# nothing stable to hash.
+
+# Bump whenever a change to the simulation changes its results.
+ENGINE_VERSION = 2
+
+DEFAULT_PATH = "output/result_cache.sqlite"
+DEFAULT_MAX_BYTES = 256 << 20
+
+
+class CachedRun(namedtuple("CachedRun", ["columns", "rows", "failure_year", "failure_reason", "failure_message",
+                                         "balances"])):
+    def result(self, start_historic_year: int) -> SimulationResult:
+        return SimulationResult(start_historic_year, self.failure_year, self.balances)
+
+    def write(self, sink: results.ResultSink):
+        with sink:
+            sink.open(self.columns)
+            for row in self.rows:
+                sink.write(row)
+
+
+def simulate(template: scenario_file.ScenarioTemplate, start_historic_year: int, end_year: int = END_YEAR,
+             annual: bool = False, prune: bool = False) -> CachedRun:
+    manager, expenses, start_year = template(start_historic_year)
+    simulation = Simulation(manager, expenses, start_year, end_year, annual, prune)
+    columns = [results.Column("year", results.NUMBER), results.Column("income", results.MONEY)] + manager.row_header()
+    rows = []
+    simulation.run(on_year=lambda year: rows.append([year, expenses.amount(year)] + manager.row_values(year)))
+    return CachedRun(columns, rows, simulation.failure_year, simulation.failure_reason, simulation.failure_message,
+                     manager.balances())
+
+
+def run_key(template: scenario_file.ScenarioTemplate, start_historic_year: int, end_year: int = END_YEAR,
+            annual: bool = False, prune: bool = False) -> str:
+    if not isinstance(template, scenario_file.ScenarioTemplate):
+        raise ValueError(f"only scenario files can be cached, not {template!r}")
+    digest = hashlib.sha256()
+    # namedtuples are lists to json, so this is every field in a fixed order
+    digest.update(json.dumps([ENGINE_VERSION, template, start_historic_year, end_year, annual, prune]).encode())
+    views = [historical_recast.s_p_500_view(template.start_year, start_historic_year, template.market_rate),
+             historical_recast.inflation_view(template.start_year, start_historic_year, template.inflation_rate)]
+    views.extend(rate_table.load(file_name).view(template.start_year, start_historic_year, rate)
+                 for _, file_name, rate in template.asset_classes if file_name is not None)
+    for view in views:
+        digest.update(array.array("d", [view[year] for year in range(template.start_year, end_year + 1)]).tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS runs "
+                         "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS runs_used ON runs (used)")
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get(self, key: str) -> Optional[CachedRun]:
+        found = self._db.execute("SELECT value FROM runs WHERE key = ?", (key,)).fetchone()
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._db.execute("UPDATE runs SET used = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return _decode(found[0])
+
+    def put(self, key: str, run: CachedRun):
+        self.put_many([(key, run)])
+
+    def put_many(self, runs: Iterable[Tuple[str, CachedRun]]):
+        now = time.time()
+        values = [(key, _encode(run)) for key, run in runs]
+        self._db.executemany("INSERT OR REPLACE INTO runs (key, value, size, used) VALUES (?, ?, ?, ?)",
+                             [(key, value, len(value), now) for key, value in values])
+        self._evict()
+        self._db.commit()
+
+    def size(self) -> Tuple[int, int]:
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM runs").fetchone()
+        return count, size
+
+    def clear(self):
+        self._db.execute("DELETE FROM runs")
+        self._db.commit()
+
+    def _evict(self):
+        _, size = self.size()
+        if size <= self.max_bytes:
+            return
+        stale = []
+        for key, entry_size in self._db.execute("SELECT key, size FROM runs ORDER BY used"):
+            if size <= self.max_bytes:
+                break
+            stale.append((key,))
+            size -= entry_size
+        self._db.executemany("DELETE FROM runs WHERE key = ?", stale)
+
+    def run(self, template: scenario_file.ScenarioTemplate, start_historic_year: int, end_year: int = END_YEAR,
+            annual: bool = False, prune: bool = False) -> CachedRun:
+        key = run_key(template, start_historic_year, end_year, annual, prune)
+        found = self.get(key)
+        if found is None:
+            found = simulate(template, start_historic_year, end_year, annual, prune)
+            self.put(key, found)
+        return found
+
+    def sweep(self, template: scenario_file.ScenarioTemplate,
+              start_historic_years: Iterable[int] = range(FIRST_HISTORIC_YEAR, LAST_HISTORIC_YEAR + 1),
+              end_year: int = END_YEAR,
+              max_workers: Optional[int] = None,
+              annual: bool = False,
+              prune: bool = False) -> SweepResult:
+        """
+        sweep.sweep with cached runs, only the start years missing from the cache
+        are simulated, on a process pool unless max_workers=1.
+        """
+        years = list(start_historic_years)
+        keys = {year: run_key(template, year, end_year, annual, prune) for year in years}
+        runs: Dict[int, CachedRun] = {year: self.get(keys[year]) for year in years}
+        missing = [year for year in years if runs[year] is None]
+
+        run = functools.partial(simulate, template, end_year=end_year, annual=annual, prune=prune)
+        if max_workers == 1 or len(missing) <= 1:
+            simulated = [run(year) for year in missing]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                simulated = list(executor.map(run, missing))
+        runs.update(zip(missing, simulated))
+        self.put_many((keys[year], found) for year, found in zip(missing, simulated))
+        return SweepResult([runs[year].result(year) for year in years])
+
+
+def _encode(run: CachedRun) -> bytes:
+    return zlib.compress(json.dumps(run).encode())
+
+
+def _decode(value: bytes) -> CachedRun:
+    columns, rows, failure_year, failure_reason, failure_message, balances = json.loads(zlib.decompress(value))
+    return CachedRun([results.Column(*column) for column in columns], rows, failure_year, failure_reason,
+                     failure_message, balances)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Sweep a scenario file, reusing cached runs.")
+    parser.add_argument("--scenario", default="scenario_files/example.toml")
+    parser.add_argument("--first-year", type=int, default=FIRST_HISTORIC_YEAR)
+    parser.add_argument("--last-year", type=int, default=LAST_HISTORIC_YEAR)
+    parser.add_argument("--end-year", type=int, default=END_YEAR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--annual", action="store_true")
+    parser.add_argument("--prune", action="store_true")
+    parser.add_argument("--cache", default=DEFAULT_PATH)
+    parser.add_argument("--max-mb", type=float, default=DEFAULT_MAX_BYTES / (1 << 20))
+    parser.add_argument("--clear", action="store_true", help="empty the cache first")
+    args = parser.parse_args(argv)
+
+    with ResultCache(args.cache, int(args.max_mb * (1 << 20))) as cache:
+        if args.clear:
+            cache.clear()
+        result = cache.sweep(scenario_file.load(args.scenario), range(args.first_year, args.last_year + 1),
+                             args.end_year, args.workers, args.annual, args.prune)
+        print(result.summary())
+        count, size = cache.size()
+        print(f"{cache.hits} cached, {cache.misses} simulated, {count} runs {size / (1 << 20):.1f}MB in {args.cache}")
+
+
+if __name__ == "__main__":
+    main()
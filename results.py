@@ -0,0 +1,152 @@
+import array
+import csv
+from collections import namedtuple
+from typing import List
+from typing import Sequence
+
+# Simulation output is a list of typed columns and rows of plain numbers.
+# Text formatting only happens in the human readable csv writer.
+
+MONEY = "money"
+PERCENT = "percent"
+NUMBER = "number"
+
+Column = namedtuple("Column", ["name", "kind"])
+
+
+def format_value(kind: str, value: float) -> str:
+    if kind == MONEY:
+        return f"${value:,.2f}"
+    elif kind == PERCENT:
+        return f"{value * 100:,.1f}%"
+    else:
+        return f"{int(value)}"
+
+
+def format_header(columns: Sequence[Column]) -> str:
+    output = ""
+    for column in columns:
+        output += f";{column.name}"
+    return output
+
+
+def format_row(columns: Sequence[Column], values: Sequence[float]) -> str:
+    output = ""
+    for column, value in zip(columns, values):
+        output += f";{format_value(column.kind, value)}"
+    return output
+
+
+def unique_names(columns: Sequence[Column]) -> List[str]:
+    # headers repeat names like "amount" once per bracket
+    names = []
+    seen = set()
+    for c, column in enumerate(columns):
+        name = column.name if column.name not in seen else f"{column.name}.{c}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+class ResultSink(object):
+    def open(self, columns: List[Column]):
+        self.columns = columns
+
+    def write(self, row: Sequence[float]):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class CsvSink(ResultSink):
+    """
+    Plain numeric csv. human=True writes the semicolon separated, currency
+    formatted file main.py has always written.
+    """
+
+    def __init__(self, file_name: str, human: bool = False, buffer_rows: int = 1024):
+        self.file_name = file_name
+        self.human = human
+        self.buffer_rows = buffer_rows
+        self.columns = []
+        self._rows = []
+        self._file = None
+
+    def open(self, columns: List[Column]):
+        self.columns = columns
+        self._file = open(self.file_name, "w", newline="")
+        if self.human:
+            self._file.write(format_header(columns)[1:] + "\n")
+        else:
+            csv.writer(self._file).writerow(unique_names(columns))
+
+    def write(self, row: Sequence[float]):
+        self._rows.append(row)
+        if len(self._rows) >= self.buffer_rows:
+            self._flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self._flush()
+        self._file.close()
+        self._file = None
+
+    def _flush(self):
+        if self.human:
+            self._file.writelines(format_row(self.columns, row)[1:] + "\n" for row in self._rows)
+        else:
+            csv.writer(self._file).writerows(self._rows)
+        self._rows = []
+
+
+class _ColumnarSink(ResultSink):
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.columns = []
+        self._values = array.array("d")
+        self._closed = False
+
+    def write(self, row: Sequence[float]):
+        self._values.extend(row)
+
+    def close(self):
+        if self._closed or not self.columns:
+            return
+        self._closed = True
+        self._save()
+
+    def _save(self):
+        pass
+
+
+class NpzSink(_ColumnarSink):
+    def _save(self):
+        import numpy as np
+
+        values = np.frombuffer(self._values, dtype=np.float64).reshape(-1, len(self.columns))
+        np.savez(self.file_name,
+                 columns=np.array(unique_names(self.columns)),
+                 kinds=np.array([column.kind for column in self.columns]),
+                 values=values)
+
+
+class ParquetSink(_ColumnarSink):
+    def _save(self):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception("ParquetSink needs pyarrow: pip install pyarrow")
+
+        width = len(self.columns)
+        names = unique_names(self.columns)
+        table = pyarrow.table({name: self._values[c::width].tolist() for c, name in enumerate(names)})
+        pyarrow.parquet.write_table(table, self.file_name)
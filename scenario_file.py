@@ -0,0 +1,363 @@
+import functools
+import json
+import os
+import tomllib
+from collections import namedtuple
+from typing import Dict
+
+import account
+import allocation
+import historical_recast
+import income
+import rate_table
+import tax_bracket
+from simulation import END_YEAR
+from tax_deductions import StandardDeductions
+from yearly_withdraw_manager import Expense
+from yearly_withdraw_manager import EndingExpense
+from yearly_withdraw_manager import Expenses
+from yearly_withdraw_manager import HousingExpense
+from yearly_withdraw_manager import YearlyWithdrawManager
+
+# Scenarios described in TOML or JSON files instead of Python, see scenario_files/.
+# A file is validated once into an immutable ScenarioTemplate. Calling the template
+# builds fresh accounts, incomes and a manager without looking at the file again:
+#   template(start_historic_year) -> (manager, expenses, start_year)
+#   template.on_path(market_by_year, inflation_by_year) -> (manager, expenses, start_year)
+# so it can be used anywhere a scenario function can, including process pools.
+# Fields are kept as tuples of (field, value) pairs so the template stays immutable.
+# An account can be invested in a mix of asset classes instead of one growth rate:
+#   [asset_classes]
+#   bonds = { file = "bonds.csv", default_rate = 0.04 }   # same format as s_p_500.csv
+#   cash = { rate = 0.02 }
+#   [[accounts]]
+#   allocation = { stocks = 0.6, bonds = 0.4 }
+#   # or by age, needs born_year: glide_path = [{ age = 60, stocks = 0.8, cash = 0.2 }, ...]
+# "stocks" are the market rates, see allocation.py.
+
+MARKET = "market"
+INFLATION = "inflation"
+
+_REQUIRED = object()
+
+# field -> (kind, default) per type, in constructor order
+_ALLOCATION = {"allocation": ("table", None), "glide_path": ("list", None)}
+_ACCOUNTS = {
+    "PreTax401k": {"name": ("str", _REQUIRED), "amount": ("number", _REQUIRED), "min_year": ("year", _REQUIRED),
+                   "growth": ("rate", MARKET), **_ALLOCATION},
+    "PostTax401k": {"name": ("str", _REQUIRED), "amount": ("number", _REQUIRED), "born_year": ("year", _REQUIRED),
+                    "min_age": ("year", 60), "growth": ("rate", MARKET), **_ALLOCATION},
+    "Taxable": {"name": ("str", _REQUIRED), "amount": ("number", _REQUIRED), "growth": ("rate", MARKET),
+                **_ALLOCATION},
+    "TaxableWithBasis": {"name": ("str", _REQUIRED), "basis": ("number", _REQUIRED), "gains": ("number", _REQUIRED),
+                         "growth": ("rate", MARKET), **_ALLOCATION},
+}
+_ASSET_CLASS = {"file": ("str", None), "rate": ("number", None), "default_rate": ("number", 0.0)}
+_INCOMES = {
+    "SSI": {"name": ("str", _REQUIRED), "monthly_payment": ("number", _REQUIRED), "min_year": ("year", _REQUIRED),
+            "growth": ("rate", INFLATION)},
+    "FixedPensionIncome": {"name": ("str", _REQUIRED), "monthly_payment": ("number", _REQUIRED),
+                           "min_year": ("year", _REQUIRED), "growth": ("rate", INFLATION)},
+}
+_EXPENSES = {
+    "Expense": {"amount": ("number", _REQUIRED)},
+    "HousingExpense": {"amount": ("number", _REQUIRED), "end_payments_year": ("year", _REQUIRED),
+                       "start_payments_year": ("year", 0)},
+    "EndingExpense": {"amount": ("number", _REQUIRED), "end_year": ("year", _REQUIRED)},
+}
+_LUMP_SUM = {"amount": ("number", _REQUIRED), "year": ("year", _REQUIRED)}
+_STRATEGY = {"group_401ks": ("bool", True), "max_tax_percent": ("number", 0.15), "percent_over_max": ("number", 0.3),
+             "conversion_tax_percent": ("number", 0.0)}
+_SCENARIO = {"name": ("str", ""), "start_year": ("year", 2025), "market_rate": ("number", 0.08),
+             "inflation_rate": ("number", 0.029), "accounts": ("list", _REQUIRED), "incomes": ("list", []),
+             "expenses": ("list", _REQUIRED), "lump_sums": ("list", []), "strategy": ("table", {}),
+             "born_year": ("year", 0), "asset_classes": ("table", {})}
+
+Item = namedtuple("Item", ["type", "fields"])
+
+
+class ScenarioTemplate(namedtuple("ScenarioTemplate", ["name", "start_year", "market_rate", "inflation_rate",
+                                                        "accounts", "incomes", "expenses", "lump_sums", "strategy",
+                                                        "born_year", "asset_classes"])):
+    def __call__(self, start_historic_year: int):
+        return self.on_path(
+            historical_recast.get_s_p_500_year_rate(self.start_year, start_historic_year, self.market_rate),
+            historical_recast.get_inflation_year_rate(self.start_year, start_historic_year, self.inflation_rate),
+            asset_rates=self.asset_rates(start_historic_year))
+
+    def file_asset_classes(self) -> list:
+        """
+        (name, file_name, default_rate) of the asset classes replayed from files.
+        """
+        return [(name, file_name, rate) for name, file_name, rate in self.asset_classes if file_name is not None]
+
+    def asset_rates(self, start_historic_year: int) -> Dict[str, rate_table.RateView]:
+        """
+        Rates of the asset classes read from files, replayed from start_historic_year,
+        as on_path takes them.
+        """
+        return {name: rate_table.load(file_name).view(self.start_year, start_historic_year, rate)
+                for name, file_name, rate in self.file_asset_classes()}
+
+    def on_path(self, market: Dict[int, float], inflation: Dict[int, float], shared=None,
+                asset_rates: Dict[str, Dict[int, float]] = None):
+        """
+        shared is a batch.SharedPath for market and inflation, its brackets and
+        deductions are used instead of new ones. asset_rates are the rates of the
+        asset classes read from files, by name.
+        """
+        start_year = self.start_year
+        strategy = dict(self.strategy)
+        if shared is None:
+            income_tax_brackets = tax_bracket.build_current_income_tax_brackets(inflation)
+            cap_gains_tax_brackets = tax_bracket.build_current_cap_gains_tax_brackets(inflation)
+            standard_deductions = StandardDeductions()
+        else:
+            income_tax_brackets = shared.income_tax_brackets
+            cap_gains_tax_brackets = shared.cap_gains_tax_brackets
+            standard_deductions = shared.standard_deductions
+        rates = {MARKET: (self.market_rate, market), INFLATION: (self.inflation_rate, inflation)}
+
+        pre_tax = []
+        traditional = []
+        taxable = []
+        class_rates = None
+        blended = {}
+        for item in self.accounts:
+            f = dict(item.fields)
+            rate, rate_by_year = rates.get(f["growth"], (f["growth"], None))
+            if item.type == "PreTax401k":
+                acc = account.PreTax401k(f["name"], f["amount"], f["min_year"], rate, start_year, 1)
+                pre_tax.append(acc)
+            elif item.type == "PostTax401k":
+                acc = account.PostTax401k(f["name"], f["amount"], f["born_year"], rate, start_year, 1, f["min_age"])
+                traditional.append(acc)
+            elif item.type == "Taxable":
+                acc = account.Taxable(f["name"], f["amount"], rate, start_year, 1)
+                taxable.append(acc)
+            else:
+                acc = account.TaxableWithBasis(f["name"], f["basis"], f["gains"], rate, start_year, 1)
+                taxable.append(acc)
+            if f["allocation"] is not None:
+                # accounts on the same allocation share its rates
+                if f["allocation"] not in blended:
+                    if class_rates is None:
+                        class_rates = self._class_rates(market, asset_rates or {})
+                    blended[f["allocation"]] = allocation.BlendedRates(
+                        allocation.Allocation(f["allocation"], self.born_year), class_rates, start_year, END_YEAR)
+                acc.set_inflate_percent_by_year(blended[f["allocation"]])
+            elif rate_by_year is not None:
+                acc.set_inflate_percent_by_year(rate_by_year)
+
+        post_tax = traditional
+        if traditional and strategy["group_401ks"]:
+            post_tax = [account.PostTax401kRateLimit("401ks", traditional, income_tax_brackets, standard_deductions,
+                                                     strategy["max_tax_percent"], strategy["percent_over_max"])]
+
+        pensions = []
+        for item in self.incomes:
+            f = dict(item.fields)
+            rate, rate_by_year = rates.get(f["growth"], (f["growth"], None))
+            pension_type = income.SSI if item.type == "SSI" else income.FixedPensionIncome
+            pension = pension_type(f["name"], f["monthly_payment"], rate, f["min_year"], start_year)
+            if rate_by_year is not None:
+                pension.set_inflate_percent_by_year(rate_by_year)
+            pensions.append(pension)
+
+        expense_list = []
+        for item in self.expenses:
+            f = dict(item.fields)
+            if item.type == "HousingExpense":
+                expense_list.append(HousingExpense(f["amount"], start_year, f["end_payments_year"],
+                                                   f["start_payments_year"]))
+            elif item.type == "EndingExpense":
+                expense_list.append(EndingExpense(f["amount"], start_year, f["end_year"]))
+            else:
+                expense_list.append(Expense(f["amount"], start_year))
+        expenses = Expenses(expense_list, self.inflation_rate)
+        expenses.set_inflate_percent_by_year(inflation)
+
+        manager = YearlyWithdrawManager(
+            post_tax_accounts=post_tax,
+            pre_tax_accounts=pre_tax,
+            taxable_accounts=taxable,
+            pension_accounts=pensions,
+            income_tax_brackets=income_tax_brackets,
+            cap_gains_tax_brackets=cap_gains_tax_brackets,
+            standard_deductions=standard_deductions,
+            market_increase_by_year=market,
+            inflation_percent_by_year=inflation,
+            lump_sum_payments=[income.LumpSumPayment(amount, year) for amount, year in self.lump_sums],
+            conversion_tax_percent=strategy["conversion_tax_percent"])
+        return manager, expenses, start_year
+
+    def _class_rates(self, market: Dict[int, float], asset_rates: Dict[str, Dict[int, float]]) -> dict:
+        output = {allocation.STOCKS: (market, self.market_rate)}
+        for name, file_name, rate in self.asset_classes:
+            if file_name is None:
+                output[name] = ({}, rate)
+            elif name in asset_rates:
+                output[name] = (asset_rates[name], rate)
+            else:
+                raise ValueError(f"asset class {name} replays {file_name} from a historic year, "
+                                 f"pass its rates in asset_rates, see asset_rates()")
+        return output
+
+    def with_allocation(self, weights: Dict[str, float], account_names=None) -> "ScenarioTemplate":
+        """
+        The same scenario with the named accounts, all when None, invested in weights,
+        for sweeping over allocations.
+        """
+        names = {allocation.STOCKS} | {name for name, _, _ in self.asset_classes}
+        points = _allocation_points([(0, weights)], names, "with_allocation")
+        accounts = []
+        for item in self.accounts:
+            f = dict(item.fields)
+            if account_names is None or f["name"] in account_names:
+                f["allocation"] = points
+            accounts.append(Item(item.type, tuple(f.items())))
+        return self._replace(accounts=tuple(accounts))
+
+
+def load(file_name: str) -> ScenarioTemplate:
+    path = os.path.abspath(file_name)
+    return _load(path, os.path.getmtime(path))
+
+
+@functools.lru_cache(maxsize=None)
+def _load(path: str, modified: float) -> ScenarioTemplate:
+    with open(path, "rb") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+        else:
+            data = tomllib.load(f)
+    try:
+        return compile_scenario(data)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}")
+
+
+def compile_scenario(data: dict) -> ScenarioTemplate:
+    scenario = _fields(data, _SCENARIO, "scenario")
+    asset_classes = []
+    for name, entry in scenario["asset_classes"].items():
+        f = _fields(entry, _ASSET_CLASS, f"asset_classes.{name}")
+        if name == allocation.STOCKS:
+            raise ValueError(f"asset_classes.{name}: {allocation.STOCKS} are the market rates")
+        if (f["file"] is None) == (f["rate"] is None):
+            raise ValueError(f"asset_classes.{name}: needs either a file or a rate")
+        asset_classes.append((name, f["file"], f["default_rate"] if f["rate"] is None else f["rate"]))
+    class_names = {allocation.STOCKS} | {name for name, _, _ in asset_classes}
+
+    accounts = []
+    for i, entry in enumerate(scenario["accounts"]):
+        item = _item(entry, _ACCOUNTS, f"accounts[{i}]")
+        accounts.append(_with_allocation(item, class_names, scenario["born_year"], f"accounts[{i}]"))
+    if not any(item.type == "PreTax401k" for item in accounts):
+        raise ValueError("accounts: needs a PreTax401k account, conversions go into the first one")
+    lump_sums = []
+    for i, entry in enumerate(scenario["lump_sums"]):
+        f = _fields(entry, _LUMP_SUM, f"lump_sums[{i}]")
+        lump_sums.append((f["amount"], f["year"]))
+    if lump_sums and not any(item.type in ("Taxable", "TaxableWithBasis") for item in accounts):
+        raise ValueError("lump_sums: need a Taxable or TaxableWithBasis account to be paid into")
+    names = [dict(item.fields)["name"] for item in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError(f"accounts: names must be unique: {names}")
+
+    return ScenarioTemplate(
+        name=scenario["name"],
+        start_year=scenario["start_year"],
+        market_rate=scenario["market_rate"],
+        inflation_rate=scenario["inflation_rate"],
+        accounts=tuple(accounts),
+        incomes=tuple(_item(entry, _INCOMES, f"incomes[{i}]") for i, entry in enumerate(scenario["incomes"])),
+        expenses=tuple(_item(entry, _EXPENSES, f"expenses[{i}]") for i, entry in enumerate(scenario["expenses"])),
+        lump_sums=tuple(lump_sums),
+        strategy=tuple(_fields(scenario["strategy"], _STRATEGY, "strategy").items()),
+        born_year=scenario["born_year"],
+        asset_classes=tuple(asset_classes))
+
+
+def _with_allocation(item: Item, class_names: set, born_year: int, where: str) -> Item:
+    # allocation and glide_path become one "allocation" field of (age, weights) points, or None
+    f = dict(item.fields)
+    weights = f.pop("allocation")
+    glide_path = f.pop("glide_path")
+    points = None
+    if weights is not None and glide_path is not None:
+        raise ValueError(f"{where}: has both an allocation and a glide_path")
+    if weights is not None:
+        points = _allocation_points([(0, weights)], class_names, f"{where}.allocation")
+    elif glide_path is not None:
+        if not born_year:
+            raise ValueError(f"{where}.glide_path: needs the scenario born_year")
+        ages = []
+        for p, point in enumerate(glide_path):
+            if not isinstance(point, dict) or "age" not in point:
+                raise ValueError(f"{where}.glide_path[{p}]: expected a table with an age")
+            point = dict(point)
+            ages.append((_value(point.pop("age"), "year", f"{where}.glide_path[{p}].age"), point))
+        if not ages:
+            raise ValueError(f"{where}.glide_path: is empty")
+        points = _allocation_points(ages, class_names, f"{where}.glide_path")
+    f["allocation"] = points
+    return Item(item.type, tuple(f.items()))
+
+
+def _allocation_points(points: list, class_names: set, where: str) -> tuple:
+    output = []
+    for age, weights in sorted(points, key=lambda point: point[0]):
+        unknown = set(weights) - class_names
+        if unknown:
+            raise ValueError(f"{where}: unknown asset classes {', '.join(sorted(unknown))}")
+        allocation.check_weights(weights, where)
+        output.append((age, tuple(sorted((name, float(weight)) for name, weight in weights.items()))))
+    return tuple(output)
+
+
+def _item(entry: dict, types: Dict[str, dict], where: str) -> Item:
+    if not isinstance(entry, dict):
+        raise ValueError(f"{where}: expected a table")
+    entry = dict(entry)
+    kind = entry.pop("type", None)
+    if kind not in types:
+        raise ValueError(f"{where}: type must be one of {', '.join(types)}, not {kind!r}")
+    return Item(kind, tuple(_fields(entry, types[kind], f"{where} ({kind})").items()))
+
+
+def _fields(entry: dict, schema: dict, where: str) -> dict:
+    if not isinstance(entry, dict):
+        raise ValueError(f"{where}: expected a table")
+    unknown = set(entry) - set(schema)
+    if unknown:
+        raise ValueError(f"{where}: unknown fields {', '.join(sorted(unknown))}")
+
+    output = {}
+    for field, (kind, default) in schema.items():
+        if field not in entry:
+            if default is _REQUIRED:
+                raise ValueError(f"{where}: missing {field}")
+            output[field] = default
+        else:
+            output[field] = _value(entry[field], kind, f"{where}.{field}")
+    return output
+
+
+def _value(value, kind: str, where: str):
+    if kind == "rate" and value in (MARKET, INFLATION):
+        return value
+    if kind in ("number", "rate") and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if kind == "year" and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if kind == "str" and isinstance(value, str):
+        return value
+    if kind == "bool" and isinstance(value, bool):
+        return value
+    if kind == "list" and isinstance(value, list):
+        return value
+    if kind == "table" and isinstance(value, dict):
+        return value
+    expected = {"rate": f"a number, {MARKET!r} or {INFLATION!r}"}.get(kind, f"a {kind}")
+    raise ValueError(f"{where}: expected {expected}, not {value!r}")
@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import rate_table
+import results
+import scenario_file
+import sweep
+from simulation import END_YEAR
+from simulation import Simulation
+from sweep import FIRST_HISTORIC_YEAR
+from sweep import LAST_HISTORIC_YEAR
+
+# Local HTTP/JSON front end for the simulator, stdlib asyncio only:
+#   POST /simulate {"scenario": {...}, "start_historic_year": 2025, "end_year": 2092, "annual": false}
+#     one row per simulated year, then {"done": true, "success": ..., "failure_year": ...}
+#   POST /sweep {"scenario": {...}, "first_year": 1960, "last_year": 2024, "end_year": 2092,
+#                "annual": false, "prune": false}
+#     one row per start year as it finishes, then {"done": true, "success_count": ..., "total": ...}
+#   GET /health
+# "scenario" is a scenario file table, see scenario_file.py. Responses are NDJSON written
+# while the simulations run. Worker processes are started once with the rate tables
+# loaded and send their rows back over one queue. A request identical to one still
+# running follows that one instead of simulating again.
+
+RATE_FILES = ["s_p_500.csv", "inflation.csv"]
+MAX_BODY = 1 << 20
+
+_SIMULATE = {"scenario": dict, "start_historic_year": int, "end_year": int, "annual": bool}
+_SWEEP = {"scenario": dict, "first_year": int, "last_year": int, "end_year": int, "annual": bool, "prune": bool}
+
+# queue back to the server, set in every worker process
+_rows = None
+
+
+def _init_worker(rows: multiprocessing.Queue):
+    global _rows
+    _rows = rows
+    for file_name in RATE_FILES:
+        rate_table.load(file_name)
+
+
+def _simulate(job_id: int, template: scenario_file.ScenarioTemplate, start_historic_year: int,
+              end_year: int, annual: bool):
+    try:
+        manager, expenses, start_year = template(start_historic_year)
+        simulation = Simulation(manager, expenses, start_year, end_year, annual)
+        names = results.unique_names([results.Column("year", results.NUMBER),
+                                      results.Column("income", results.MONEY)] + manager.row_header())
+
+        def on_year(year: int):
+            values = [year, expenses.amount(year)] + manager.row_values(year)
+            # the top brackets go to infinity, which JSON has no number for
+            _rows.put((job_id, {name: value if math.isfinite(value) else None for name, value in zip(names, values)}))
+
+        simulation.run(on_year=on_year)
+        _rows.put((job_id, {"done": True, "success": simulation.failure_year is None,
+                            "failure_year": simulation.failure_year, "failure_reason": simulation.failure_reason,
+                            "failure_message": simulation.failure_message, "balances": manager.balances()}))
+    except Exception as e:
+        _rows.put((job_id, {"error": str(e)}))
+    _rows.put((job_id, None))
+
+
+def _sweep_year(job_id: int, template: scenario_file.ScenarioTemplate, start_historic_year: int,
+                end_year: int, annual: bool, prune: bool):
+    try:
+        result = sweep.run_start_year(template, start_historic_year, end_year, annual, prune)
+        _rows.put((job_id, {"start_historic_year": start_historic_year, "success": result.success,
+                            "failure_year": result.failure_year, "balance": result.total_balance()}))
+    except Exception as e:
+        _rows.put((job_id, {"start_historic_year": start_historic_year, "error": str(e)}))
+    _rows.put((job_id, None))
+
+
+def _sweep_summary(rows: List[dict]) -> dict:
+    return {"done": True, "success_count": sum(1 for row in rows if row.get("success")), "total": len(rows)}
+
+
+class _Job(object):
+    """
+    Rows of one request, kept until it finishes so later identical requests can
+    replay what they missed.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, key: tuple, tasks: int,
+                 summary: Optional[Callable[[List[dict]], dict]]):
+        self.loop = loop
+        self.key = key
+        self.tasks = tasks
+        self.summary = summary
+        self.rows: List[dict] = []
+        self.done = False
+        self._changed = loop.create_future()
+
+    def add(self, row: dict):
+        self.rows.append(row)
+        self._notify()
+
+    def finish(self):
+        if self.summary is not None:
+            self.rows.append(self.summary(self.rows))
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        self._changed.set_result(None)
+        self._changed = self.loop.create_future()
+
+    async def follow(self):
+        sent = 0
+        while True:
+            while sent < len(self.rows):
+                yield self.rows[sent]
+                sent += 1
+            if self.done:
+                return
+            await self._changed
+
+
+class SweepService(object):
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers
+        self.jobs: Dict[int, _Job] = {}
+        self.in_flight: Dict[tuple, _Job] = {}
+        self.simulations = 0
+        self._next_id = 0
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        # forked workers would hold on to the sockets open at the time, keeping connections open
+        context = multiprocessing.get_context("spawn")
+        self.queue = context.Queue()
+        self._context = context
+        self.executor = self._new_executor()
+        self._pump = threading.Thread(target=self._pump_rows, daemon=True)
+        self._pump.start()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.max_workers, self._context, initializer=_init_worker, initargs=(self.queue,))
+
+    def close(self):
+        self.executor.shutdown()
+        self.queue.put(None)
+        self._pump.join()
+
+    def _pump_rows(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self.loop.call_soon_threadsafe(self._deliver, *item)
+
+    def _deliver(self, job_id: int, row: Optional[dict]):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        if row is not None:
+            job.add(row)
+            return
+        # a task is done
+        job.tasks -= 1
+        if job.tasks == 0:
+            del self.jobs[job_id]
+            del self.in_flight[job.key]
+            job.finish()
+
+    def submit(self, key: tuple, tasks: List[tuple],
+               summary: Callable[[List[dict]], dict] = None) -> _Job:
+        """
+        Runs every (function, *args) task with a job id in front, or returns the
+        job already running for key.
+        """
+        job = self.in_flight.get(key)
+        if job is not None:
+            return job
+
+        job_id = self._next_id
+        self._next_id += 1
+        job = _Job(self.loop, key, len(tasks), summary)
+        self.jobs[job_id] = job
+        self.in_flight[key] = job
+        for function, *args in tasks:
+            try:
+                future = self.executor.submit(function, job_id, *args)
+            except BrokenProcessPool:
+                # a worker died earlier, its jobs got an error row, later ones get a new pool
+                self.executor.shutdown(wait=False)
+                self.executor = self._new_executor()
+                future = self.executor.submit(function, job_id, *args)
+            future.add_done_callback(lambda f, job_id=job_id: self._broken(job_id, f))
+        self.simulations += len(tasks)
+        return job
+
+    def _broken(self, job_id: int, future):
+        # the tasks report their own errors, this only happens when a worker dies
+        if not future.cancelled() and future.exception() is None:
+            return
+        self.loop.call_soon_threadsafe(self._deliver, job_id, {"error": f"worker failed: {future.exception()!r}"})
+        self.loop.call_soon_threadsafe(self._deliver, job_id, None)
+
+    def simulate(self, payload: dict) -> _Job:
+        options = _options(payload, _SIMULATE, {"start_historic_year": 2025, "end_year": END_YEAR,
+                                                "annual": False})
+        template = scenario_file.compile_scenario(options["scenario"])
+        args = (template, options["start_historic_year"], options["end_year"], options["annual"])
+        return self.submit(("simulate",) + args, [(_simulate,) + args])
+
+    def sweep(self, payload: dict) -> _Job:
+        options = _options(payload, _SWEEP, {"first_year": FIRST_HISTORIC_YEAR, "last_year": LAST_HISTORIC_YEAR,
+                                             "end_year": END_YEAR, "annual": False, "prune": False})
+        template = scenario_file.compile_scenario(options["scenario"])
+        years = range(options["first_year"], options["last_year"] + 1)
+        if not years:
+            raise ValueError("last_year is before first_year")
+        rest = (options["end_year"], options["annual"], options["prune"])
+        key = ("sweep", template, options["first_year"], options["last_year"]) + rest
+        return self.submit(key, [(_sweep_year, template, year) + rest for year in years], _sweep_summary)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, body = await _read_request(reader)
+                if method == "GET" and path == "/health":
+                    await _respond(writer, 200, {"status": "ok", "in_flight": len(self.in_flight),
+                                                 "simulations": self.simulations})
+                    return
+                routes = {"/simulate": self.simulate, "/sweep": self.sweep}
+                if path not in routes:
+                    await _respond(writer, 404, {"error": f"no such endpoint {path}"})
+                    return
+                if method != "POST":
+                    await _respond(writer, 405, {"error": f"{path} needs POST"})
+                    return
+                payload = json.loads(body or b"{}")
+                if not isinstance(payload, dict):
+                    raise ValueError("expected a JSON object")
+                job = routes[path](payload)
+            except ValueError as e:
+                # json.JSONDecodeError is a ValueError too
+                await _respond(writer, 400, {"error": str(e)})
+                return
+            except asyncio.IncompleteReadError as e:
+                await _respond(writer, 400, {"error": f"body ended after {len(e.partial)} of {e.expected} bytes"})
+                return
+
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nConnection: close\r\n\r\n")
+            async for row in job.follow():
+                writer.write(json.dumps(row).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            # the client left, the job keeps going for anyone else following it
+            pass
+        finally:
+            writer.close()
+
+
+def _options(payload: dict, schema: Dict[str, type], defaults: dict) -> dict:
+    unknown = set(payload) - set(schema)
+    if unknown:
+        raise ValueError(f"unknown fields {', '.join(sorted(unknown))}")
+    output = {}
+    for field, kind in schema.items():
+        if field not in payload:
+            if field not in defaults:
+                raise ValueError(f"missing {field}")
+            output[field] = defaults[field]
+            continue
+        value = payload[field]
+        # bool is an int too
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+            raise ValueError(f"{field}: expected a {kind.__name__}, not {value!r}")
+        output[field] = value
+    return output
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+    parts = (await reader.readline()).decode("latin-1").split()
+    if len(parts) != 3:
+        raise ValueError("bad request line")
+    method, target, _ = parts
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", "0"))
+    if length > MAX_BODY:
+        raise ValueError(f"body over {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method, target.partition("?")[0], body
+
+
+async def _respond(writer: asyncio.StreamWriter, status: int, body: dict):
+    reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+    data = json.dumps(body).encode() + b"\n"
+    writer.write(f"HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+    await writer.drain()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8765, max_workers: Optional[int] = None):
+    service = SweepService(max_workers)
+    await service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"serving on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Serve simulations and sweeps over HTTP as NDJSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
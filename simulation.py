@@ -0,0 +1,210 @@
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+from yearly_withdraw_manager import YearlyWithdrawManager
+from yearly_withdraw_manager import Expenses
+
+END_YEAR = 2092
+
+# Annual mode grows the accounts to this month, withdraws the whole year then and
+# grows them to december. Monthly withdrawals happen on average half way through the year.
+ANNUAL_WITHDRAW_MONTH = 6
+
+OUT_OF_MONEY = "out of money"
+PENSION_OVER_INCOME = "pension over income"
+PROJECTED_SHORTFALL = "projected shortfall"
+
+# With prune=True, run() fails a path at the start of the first year its savings are
+# below the reserve it would need to make it to end_year if every account grew at the
+# best monthly rate any account gets that year, no taxes were paid and every account
+# could be withdrawn from. Savings can only do worse than that, so a pruned path would
+# have run out of money later anyway: pruning moves failure years earlier, it never
+# turns a success into a failure. Years from the first one the pensions cover all
+# expenses are left out, those fail with PENSION_OVER_INCOME and not a shortfall.
+_PRUNE_ROUNDING = 1e-9
+
+
+class SimulationResult(object):
+    def __init__(self, start_historic_year: int, failure_year: Optional[int], balances: Dict[str, float]):
+        self.start_historic_year = start_historic_year
+        self.failure_year = failure_year
+        self.balances = balances
+
+    @property
+    def success(self) -> bool:
+        return self.failure_year is None
+
+    def total_balance(self) -> float:
+        return sum(self.balances.values())
+
+
+class Simulation(object):
+    def __init__(self, manager: YearlyWithdrawManager, expenses: Expenses, start_year: int,
+                 end_year: int = END_YEAR, annual: bool = False, prune: bool = False):
+        self.manager = manager
+        self.expenses = expenses
+        self.year = start_year
+        self.end_year = end_year
+        self.annual = annual
+        self.prune = prune
+        self.taxes = 0.0
+        self.failure_year = None
+        self.failure_reason = None
+        self.failure_message = None
+
+    @property
+    def done(self) -> bool:
+        return self.failure_year is not None or self.year > self.end_year
+
+    def step(self) -> bool:
+        year = self.year
+        manager = self.manager
+        yearly_income = self._start_year(year)
+        if self.annual:
+            # one withdraw per year, so RMDs and bracket limits are only worked out once
+            manager.increase(year, ANNUAL_WITHDRAW_MONTH)
+            if not self._withdraw_year(year, yearly_income):
+                return False
+            manager.increase(year, 12)
+            return self._end_year(year)
+
+        for month in range(1, 13):
+            manager.increase(year, month)
+            if not self._withdraw_month(year, yearly_income):
+                return False
+
+        return self._end_year(year)
+
+    # The phases of step(), BatchSimulation runs them itself to grow many portfolios at once.
+
+    def _start_year(self, year: int) -> float:
+        manager = self.manager
+        self.expenses.inflate(year)
+        manager.inflate(year)
+        manager.set_total_predicted_income_taxes(year)
+        # jan 1st
+        yearly_income = self.expenses.amount(year)
+        manager.pay_taxes(self.taxes, year)
+        return yearly_income
+
+    def _withdraw_month(self, year: int, yearly_income: float) -> bool:
+        manager = self.manager
+        monthly_income = yearly_income / 12
+        pension = manager.monthly_pension(year)
+        monthly_income -= pension
+        if monthly_income < 0:
+            return self._fail(year, PENSION_OVER_INCOME,
+                              f"pension payment is more than needed income {pension:,.2f}")
+        monthly_left_over = manager.withdraw(monthly_income, year)
+        if monthly_left_over > 0:
+            return self._fail(year, OUT_OF_MONEY, f"out of money year {year} {monthly_left_over}")
+        return True
+
+    def _withdraw_year(self, year: int, yearly_income: float) -> bool:
+        manager = self.manager
+        pension = manager.yearly_pension(year)
+        yearly_income -= pension
+        if yearly_income < 0:
+            return self._fail(year, PENSION_OVER_INCOME,
+                              f"pension payment is more than needed income {pension:,.2f}")
+        left_over = manager.withdraw(yearly_income, year)
+        if left_over > 0:
+            return self._fail(year, OUT_OF_MONEY, f"out of money year {year} {left_over}")
+        return True
+
+    def _end_year(self, year: int) -> bool:
+        manager = self.manager
+        manager.conversions(year)
+        manager.lump_sum_payments(year)
+        self.taxes = manager.taxes(year).total()
+        self.year += 1
+        return True
+
+    def run(self, until_year: Optional[int] = None, on_year: Callable[[int], None] = None) -> bool:
+        last_year = self.end_year if until_year is None else min(until_year, self.end_year)
+        # worked out per run, branches can change the expenses in between
+        reserves = self.reserves() if self.prune else None
+        while self.failure_year is None and self.year <= last_year:
+            if reserves is not None and not self._can_cover(reserves.get(self.year, 0.0)):
+                return False
+            if not self.step():
+                return False
+            if on_year:
+                # Dec 31st
+                on_year(self.year - 1)
+        return self.failure_year is None
+
+    def reserves(self) -> Optional[Dict[int, float]]:
+        """
+        Savings needed at the start of each remaining year under the best case
+        described at PROJECTED_SHORTFALL, None when a pension can't be projected.
+        """
+        manager = self.manager
+        needs = {}
+        for year in range(self.year, self.end_year + 1):
+            pension = manager.projected_monthly_pension(year)
+            if pension is None:
+                return None
+            need = self.expenses.projected_amount(year) / 12 - pension
+            if need < 0:
+                break
+            needs[year] = need
+
+        output = {}
+        reserve = 0.0
+        for year in reversed(needs):
+            growth = manager.monthly_growth_bound(year)
+            reserve = max(reserve - manager.lump_sum_amount(year), 0.0)
+            if self.annual:
+                reserve = reserve / growth ** (12 - ANNUAL_WITHDRAW_MONTH)
+                reserve = (reserve + needs[year] * 12) / growth ** ANNUAL_WITHDRAW_MONTH
+            else:
+                # twelve times reserve = (reserve + need) / growth
+                discount = 1 / growth
+                reserve = reserve * discount ** 12 + needs[year] * sum(discount ** month for month in range(1, 13))
+            output[year] = reserve
+        return output
+
+    def _can_cover(self, reserve: float) -> bool:
+        savings = sum(self.manager.balances().values())
+        if savings >= reserve * (1 - _PRUNE_ROUNDING):
+            return True
+        return self._fail(self.year, PROJECTED_SHORTFALL,
+                          f"projected shortfall year {self.year} ${savings:,.2f} saved, "
+                          f"${reserve:,.2f} needed to reach {self.end_year}")
+
+    def snapshot(self) -> tuple:
+        return (self.year, self.taxes, self.failure_year, self.failure_reason, self.failure_message,
+                self.manager.snapshot(), self.expenses.snapshot())
+
+    def restore(self, state: tuple):
+        (self.year, self.taxes, self.failure_year, self.failure_reason, self.failure_message,
+         manager_state, expenses_state) = state
+        self.manager.restore(manager_state)
+        self.expenses.restore(expenses_state)
+
+    def result(self, start_historic_year: int) -> SimulationResult:
+        return SimulationResult(start_historic_year, self.failure_year, self.manager.balances())
+
+    def run_branches(self, branch_year: int, branches: Dict[str, Callable[["Simulation"], None]],
+                     start_historic_year: int = None) -> Dict[str, SimulationResult]:
+        """
+        Simulate up to branch_year once, then for each branch restore that state,
+        let the branch change the scenario and simulate the rest.
+        """
+        self.run(until_year=branch_year - 1)
+        state = self.snapshot()
+        output = {}
+        for name, branch in branches.items():
+            self.restore(state)
+            branch(self)
+            self.run()
+            output[name] = self.result(start_historic_year)
+        return output
+
+    def _fail(self, year: int, reason: str, message: str) -> bool:
+        self.failure_year = year
+        self.failure_reason = reason
+        self.failure_message = message
+        return False
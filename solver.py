@@ -0,0 +1,170 @@
+import argparse
+import functools
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from simulation import END_YEAR
+from simulation import PENSION_OVER_INCOME
+from simulation import Simulation
+from sweep import FIRST_HISTORIC_YEAR
+from sweep import LAST_HISTORIC_YEAR
+from sweep import load_scenario
+
+# Finds the largest initial yearly expenses a scenario survives. The scenario's
+# Expenses are scaled as a whole, so their mix stays the same.
+# Assumes spending more never turns a failing start year into a success.
+
+
+class MaxExpenses(object):
+    def __init__(self, start_historic_year: int, base_amount: float, starting_balance: float,
+                 scale: float, simulations: int):
+        self.start_historic_year = start_historic_year
+        self.base_amount = base_amount
+        self.starting_balance = starting_balance
+        self.scale = scale
+        self.simulations = simulations
+
+    @property
+    def amount(self) -> float:
+        return self.base_amount * self.scale
+
+    def withdrawal_rate(self) -> float:
+        return self.amount / self.starting_balance if self.starting_balance > 0 else 0.0
+
+
+class _Bisection(object):
+    # Remembers every scale already simulated, so no scale is simulated twice
+    # and each step narrows [lower(), failed].
+    def __init__(self, scenario: Callable, start_historic_year: int, end_year: int, prune: bool = False):
+        self.scenario = scenario
+        self.start_historic_year = start_historic_year
+        self.end_year = end_year
+        self.prune = prune
+        self.succeeded = 0.0
+        self.failed = math.inf
+        self.too_low = 0.0
+        self.simulations = 0
+
+    def lower(self) -> float:
+        return max(self.succeeded, self.too_low)
+
+    def survives(self, scale: float) -> bool:
+        if scale <= self.lower():
+            return True
+        if scale >= self.failed:
+            return False
+
+        manager, expenses, start_year = self.scenario(self.start_historic_year)
+        expenses.scale(scale)
+        simulation = Simulation(manager, expenses, start_year, self.end_year, prune=self.prune)
+        survived = simulation.run()
+        self.simulations += 1
+        if survived:
+            self.succeeded = scale
+        elif simulation.failure_reason == PENSION_OVER_INCOME:
+            # spending too little to even use the pensions, not a shortfall
+            self.too_low = max(self.too_low, scale)
+            return True
+        else:
+            self.failed = scale
+        return survived
+
+
+def max_expenses(scenario: Callable, start_historic_year: int, end_year: int = END_YEAR,
+                 tolerance: float = 1e-4, initial_scale: float = 1.0, max_simulations: int = 60,
+                 prune: bool = False) -> MaxExpenses:
+    manager, expenses, start_year = scenario(start_historic_year)
+    base_amount = expenses.amount(start_year)
+    starting_balance = sum(manager.balances().values())
+
+    search = _Bisection(scenario, start_historic_year, end_year, prune)
+    scale = initial_scale
+    if search.survives(scale):
+        while search.failed == math.inf and search.simulations < max_simulations:
+            scale *= 2
+            search.survives(scale)
+    else:
+        while search.lower() == 0.0 and scale > tolerance and search.simulations < max_simulations:
+            scale /= 2
+            search.survives(scale)
+
+    while search.lower() > 0.0 and search.failed != math.inf and search.simulations < max_simulations:
+        if search.failed - search.lower() <= tolerance * search.failed:
+            break
+        search.survives((search.lower() + search.failed) / 2)
+
+    # a scale only too low to use the pensions still survives, it is the lower bound when nothing higher did
+    return MaxExpenses(start_historic_year, base_amount, starting_balance, search.lower(), search.simulations)
+
+
+class SolverResult(object):
+    def __init__(self, results: List[MaxExpenses]):
+        self.results = sorted(results, key=lambda r: r.start_historic_year)
+
+    def by_year(self) -> Dict[int, float]:
+        return {r.start_historic_year: r.amount for r in self.results}
+
+    def sustainable(self, target: float) -> Optional[MaxExpenses]:
+        """
+        The largest amount that at least `target` of the start years survive.
+        """
+        if not self.results:
+            return None
+        ordered = sorted(self.results, key=lambda r: r.amount, reverse=True)
+        survivors = min(max(math.ceil(target * len(ordered)), 1), len(ordered))
+        return ordered[survivors - 1]
+
+    def simulations(self) -> int:
+        return sum(r.simulations for r in self.results)
+
+    def summary(self, target: float) -> str:
+        output = ""
+        for r in self.results:
+            output += f"{r.start_historic_year}: ${r.amount:,.2f} {r.withdrawal_rate() * 100:.2f}%\n"
+        found = self.sustainable(target)
+        if found:
+            output += f"{target * 100:.0f}% of start years survive ${found.amount:,.2f} " \
+                      f"({found.withdrawal_rate() * 100:.2f}% of the starting balance) " \
+                      f"in {self.simulations()} simulations"
+        return output
+
+
+def solve(scenario: Callable,
+          start_historic_years: Iterable[int] = range(FIRST_HISTORIC_YEAR, LAST_HISTORIC_YEAR + 1),
+          end_year: int = END_YEAR,
+          tolerance: float = 1e-4,
+          max_workers: Optional[int] = None,
+          prune: bool = False) -> SolverResult:
+    years = list(start_historic_years)
+    run = functools.partial(max_expenses, scenario, end_year=end_year, tolerance=tolerance, prune=prune)
+    if max_workers == 1:
+        return SolverResult([run(year) for year in years])
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return SolverResult(list(executor.map(run, years)))
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Find the largest yearly expenses a scenario survives.")
+    parser.add_argument("--scenario", default="scenario_files/example.toml")
+    parser.add_argument("--target", type=float, default=0.95, help="fraction of start years that must survive")
+    parser.add_argument("--first-year", type=int, default=FIRST_HISTORIC_YEAR)
+    parser.add_argument("--last-year", type=int, default=LAST_HISTORIC_YEAR)
+    parser.add_argument("--end-year", type=int, default=END_YEAR)
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--prune", action="store_true", help="stop simulations as soon as they can no longer succeed")
+    args = parser.parse_args(argv)
+
+    result = solve(load_scenario(args.scenario), range(args.first_year, args.last_year + 1), args.end_year,
+                   args.tolerance, args.workers, args.prune)
+    print(result.summary(args.target))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import functools
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from simulation import END_YEAR
+from simulation import Simulation
+from simulation import SimulationResult
+from profiling import Profiler
+import scenario_file
+
+FIRST_HISTORIC_YEAR = 1960
+LAST_HISTORIC_YEAR = 2024
+
+
+class SweepResult(object):
+    def __init__(self, results: List[SimulationResult]):
+        self.results = sorted(results, key=lambda r: r.start_historic_year)
+
+    @property
+    def total(self) -> int:
+        return len(self.results)
+
+    @property
+    def success_count(self) -> int:
+        return sum(1 for r in self.results if r.success)
+
+    def success_rate(self) -> float:
+        if not self.results:
+            return 0.0
+        return self.success_count / self.total
+
+    def failure_years(self) -> Dict[int, Optional[int]]:
+        return {r.start_historic_year: r.failure_year for r in self.results}
+
+    def ending_balances(self) -> Dict[int, float]:
+        return {r.start_historic_year: r.total_balance() for r in self.results}
+
+    def summary(self) -> str:
+        output = ""
+        for r in self.results:
+            failed = "" if r.success else f" failed {r.failure_year}"
+            output += f"{r.start_historic_year}: ${r.total_balance():,.2f}{failed}\n"
+        output += f"success {self.success_count}/{self.total} {self.success_rate() * 100:.1f}%"
+        return output
+
+
+def run_start_year(scenario: Callable, start_historic_year: int, end_year: int = END_YEAR,
+                   annual: bool = False, prune: bool = False) -> SimulationResult:
+    manager, expenses, start_year = scenario(start_historic_year)
+    simulation = Simulation(manager, expenses, start_year, end_year, annual, prune)
+    simulation.run()
+    return simulation.result(start_historic_year)
+
+
+def run_profiled_start_year(scenario: Callable, start_historic_year: int,
+                            end_year: int = END_YEAR, annual: bool = False,
+                            prune: bool = False) -> Tuple[SimulationResult, dict]:
+    manager, expenses, start_year = scenario(start_historic_year)
+    simulation = Simulation(manager, expenses, start_year, end_year, annual, prune)
+    profiler = Profiler()
+    with profiler.attach(simulation):
+        simulation.run()
+    return simulation.result(start_historic_year), profiler.stats
+
+
+def sweep(scenario: Callable,
+          start_historic_years: Iterable[int] = range(FIRST_HISTORIC_YEAR, LAST_HISTORIC_YEAR + 1),
+          end_year: int = END_YEAR,
+          max_workers: Optional[int] = None,
+          chunksize: int = 1,
+          profiler: Profiler = None,
+          annual: bool = False,
+          prune: bool = False) -> SweepResult:
+    """
+    Run scenario(start_historic_year) for every start year on a process pool.
+    scenario must be picklable (a module level function) and return (manager, expenses, start_year).
+    max_workers=1 runs in process, which is handy for debugging.
+    With a profiler every simulation is profiled and the timings are merged into it.
+    annual=True simulates one withdrawal per year, see Simulation.
+    prune=True stops paths that can no longer succeed, their failure years are
+    when that became certain instead of when the money ran out.
+    """
+    years = list(start_historic_years)
+    if profiler is None:
+        run = functools.partial(run_start_year, scenario, end_year=end_year, annual=annual, prune=prune)
+    else:
+        run = functools.partial(run_profiled_start_year, scenario, end_year=end_year, annual=annual, prune=prune)
+
+    if max_workers == 1:
+        outputs = [run(year) for year in years]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            outputs = list(executor.map(run, years, chunksize=chunksize))
+
+    if profiler is not None:
+        for _, stats in outputs:
+            profiler.merge(stats)
+        outputs = [result for result, _ in outputs]
+    return SweepResult(outputs)
+
+
+class AnnualComparison(object):
+    """
+    How far annual mode lands from monthly mode for the same start years.
+    """
+
+    def __init__(self, monthly: SweepResult, annual: SweepResult):
+        self.monthly = monthly
+        self.annual = annual
+
+    def failure_year_differences(self) -> Dict[int, Tuple[Optional[int], Optional[int]]]:
+        return {m.start_historic_year: (m.failure_year, a.failure_year)
+                for m, a in zip(self.monthly.results, self.annual.results) if m.failure_year != a.failure_year}
+
+    def max_failure_year_difference(self) -> int:
+        output = 0
+        for monthly, annual in self.failure_year_differences().values():
+            if monthly is None or annual is None:
+                return END_YEAR
+            output = max(output, abs(monthly - annual))
+        return output
+
+    def balance_errors(self) -> Dict[int, float]:
+        # ending balance error relative to monthly mode, for start years both modes survive
+        return {m.start_historic_year: abs(a.total_balance() - m.total_balance()) / m.total_balance()
+                for m, a in zip(self.monthly.results, self.annual.results)
+                if m.success and a.success and m.total_balance() > 0}
+
+    def summary(self) -> str:
+        output = ""
+        for year, (monthly, annual) in self.failure_year_differences().items():
+            output += f"{year}: failed {monthly} monthly, {annual} annual\n"
+        errors = self.balance_errors()
+        if errors:
+            output += f"ending balance error max {max(errors.values()) * 100:.2f}% " \
+                      f"mean {sum(errors.values()) / len(errors) * 100:.2f}%\n"
+        output += f"success {self.monthly.success_rate() * 100:.1f}% monthly, " \
+                  f"{self.annual.success_rate() * 100:.1f}% annual"
+        return output
+
+
+def compare_annual(scenario: Callable,
+                   start_historic_years: Iterable[int] = range(FIRST_HISTORIC_YEAR, LAST_HISTORIC_YEAR + 1),
+                   end_year: int = END_YEAR,
+                   max_workers: Optional[int] = None) -> AnnualComparison:
+    years = list(start_historic_years)
+    return AnnualComparison(sweep(scenario, years, end_year, max_workers),
+                            sweep(scenario, years, end_year, max_workers, annual=True))
+
+
+def load_scenario(spec: str) -> Callable:
+    """
+    "module:function", or a scenario file, "file.toml" for start years and "file.toml:on_path" for rate paths.
+    """
+    module_name, _, function_name = spec.partition(":")
+    if module_name.endswith((".toml", ".json")):
+        template = scenario_file.load(module_name)
+        return getattr(template, function_name) if function_name else template
+    return getattr(importlib.import_module(module_name), function_name or "inorder_rate_limit")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Run a scenario for every historical start year.")
+    parser.add_argument("--scenario", default="scenario_files/example.toml",
+                        help="scenario file, or module:function returning (manager, expenses, start_year)")
+    parser.add_argument("--first-year", type=int, default=FIRST_HISTORIC_YEAR)
+    parser.add_argument("--last-year", type=int, default=LAST_HISTORIC_YEAR)
+    parser.add_argument("--end-year", type=int, default=END_YEAR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--annual", action="store_true", help="one withdrawal per year instead of monthly")
+    parser.add_argument("--prune", action="store_true", help="stop paths as soon as they can no longer succeed")
+    parser.add_argument("--compare-annual", action="store_true", help="report how far annual mode is off")
+    parser.add_argument("--profile", action="store_true", help="print time spent per phase and class")
+    parser.add_argument("--stacks", help="write flamegraph folded stacks to this file, implies --profile")
+    args = parser.parse_args(argv)
+
+    if args.compare_annual:
+        print(compare_annual(load_scenario(args.scenario), range(args.first_year, args.last_year + 1),
+                             args.end_year, args.workers).summary())
+        return
+
+    profiler = Profiler() if args.profile or args.stacks else None
+    result = sweep(load_scenario(args.scenario),
+                   range(args.first_year, args.last_year + 1),
+                   end_year=args.end_year,
+                   max_workers=args.workers,
+                   profiler=profiler,
+                   annual=args.annual,
+                   prune=args.prune)
+    print(result.summary())
+    if profiler:
+        print(profiler.summary())
+    if args.stacks:
+        with open(args.stacks, "w") as f:
+            f.write(profiler.folded_stacks())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import bisect
+import inflation_index
+import results
 from typing import List
 from typing import Dict
 
@@ -16,34 +19,101 @@ class TaxBracketCollection(object):
         self.brackets = brackets
         self.year = year
         self.inflate_percent_by_year = inflate_percent_by_year
-
-    def csv_header(self) -> str:
-        output = ""
+        self.inflation_index = inflation_index.get(inflate_percent_by_year)
+        self.base_year = year
+        self._base_max_incomes = [bracket.max_income for bracket in brackets]
+        self.thresholds = []
+        self._previous_max = []
+        self._cumulative_taxes = []
+        self._bracket_below_percent = {}
+        self._refresh()
+
+    def _refresh(self):
+        # Tax owed on all brackets below each bracket, so tax for an income is
+        # a bisect on the thresholds plus one multiply-add. Rebuilt when the
+        # brackets inflate. thresholds is replaced, never mutated.
+        thresholds = []
+        previous_max = []
+        cumulative_taxes = []
+        taxes = 0.0
+        previous = 0.0
         for bracket in self.brackets:
-            output += f";{bracket.percentage:,.2f}"
+            thresholds.append(bracket.max_income)
+            previous_max.append(previous)
+            cumulative_taxes.append(taxes)
+            taxes += (bracket.max_income - previous) * bracket.percentage
+            previous = bracket.max_income
+        self.thresholds = thresholds
+        self._previous_max = previous_max
+        self._cumulative_taxes = cumulative_taxes
 
-        return output
+    def row_header(self) -> List[results.Column]:
+        return [results.Column(f"{bracket.percentage:,.2f}", results.MONEY) for bracket in self.brackets]
 
-    def csv(self) -> str:
-        output = ""
-        for bracket in self.brackets:
-            output += f";${bracket.max_income:,.2f}"
+    def row_values(self) -> List[float]:
+        return list(self.thresholds)
+
+    def csv_header(self) -> str:
+        return results.format_header(self.row_header())
 
-        return output
+    def csv(self) -> str:
+        return results.format_row(self.row_header(), self.row_values())
 
     def find_closest_bracket_below_percent(self, percent: float) -> TaxBracket:
+        if percent in self._bracket_below_percent:
+            return self._bracket_below_percent[percent]
+
         found_bracket = None
         for bracket in self.brackets:
             if bracket.percentage <= percent:
                 found_bracket = bracket
 
+        self._bracket_below_percent[percent] = found_bracket
         return found_bracket
 
+    def tax_for_income(self, income: float) -> float:
+        if income <= 0.0 or not self.brackets:
+            return 0.0
+        i = min(bisect.bisect_left(self.thresholds, income), len(self.brackets) - 1)
+        taxes = self._cumulative_taxes[i]
+        amount_bracket = income - self._previous_max[i]
+        if amount_bracket > 0:
+            taxes += amount_bracket * self.brackets[i].percentage
+        return taxes
+
+    def tax_for_incomes(self, incomes):
+        """
+        tax_for_income of a numpy array of incomes, for the vectorized engine.
+        """
+        # only the vectorized engine needs numpy, the object model runs without it
+        import numpy as np
+
+        incomes = np.asarray(incomes, dtype=float)
+        if not self.brackets:
+            return np.zeros_like(incomes)
+        i = np.minimum(np.searchsorted(self.thresholds, incomes, side="left"), len(self.brackets) - 1)
+        percentages = np.array([bracket.percentage for bracket in self.brackets])
+        amount_bracket = incomes - np.array(self._previous_max)[i]
+        taxes = np.array(self._cumulative_taxes)[i] + np.where(amount_bracket > 0, amount_bracket * percentages[i], 0.0)
+        return np.where(incomes <= 0.0, 0.0, taxes)
+
+    def snapshot(self) -> tuple:
+        return self.year, self.thresholds
+
+    def restore(self, state: tuple):
+        self.year, thresholds = state
+        for bracket, max_income in zip(self.brackets, thresholds):
+            bracket.max_income = max_income
+        self._refresh()
+
     def inflate(self, year: int):
-        while self.year < year:
-            self.year += 1
-            for bracket in self.brackets:
-                bracket.inflate(self.inflate_percent_by_year[year])
+        if self.year >= year:
+            return
+        ratio = self.inflation_index.ratio(self.base_year, year)
+        for bracket, base_max_income in zip(self.brackets, self._base_max_incomes):
+            bracket.max_income = base_max_income * ratio
+        self.year = year
+        self._refresh()
 
 
 def build_current_income_tax_brackets(inflation_percent_by_year: Dict[int, float]) -> TaxBracketCollection:
@@ -1,11 +1,28 @@
+import inflation_index
+
+# used until a rate path is set
+_NO_RATES = {}
+
 
 class StandardDeductions:
     def __init__(self):
         self.amount = 27700
         self.year = 2023
         self.inflation_rate = 0.029
+        self.base_amount = self.amount
+        self.base_year = self.year
+        self.inflation_index = inflation_index.get(_NO_RATES, self.inflation_rate)
+
+    def set_inflate_percent_by_year(self, inflate_percent_by_year):
+        self.inflation_index = inflation_index.get(inflate_percent_by_year, self.inflation_rate)
+
+    def snapshot(self) -> tuple:
+        return self.amount, self.year
+
+    def restore(self, state: tuple):
+        self.amount, self.year = state
 
     def inflate(self, year: int):
-        while self.year < year:
-            self.year += 1
-            self.amount *= (1.0 + self.inflation_rate)
+        if self.year < year:
+            self.amount = self.base_amount * self.inflation_index.ratio(self.base_year, year)
+            self.year = year
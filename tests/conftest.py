@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the modules live at the top of the repository, not in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,57 @@
+import tomllib
+
+import batch
+import monte_carlo
+import scenario_file
+from simulation import Simulation
+
+# An asset class replaying inflation.csv has to grow an account exactly like
+# growth = "inflation", as long as it is replayed or bootstrapped from the same
+# years as the inflation path.
+
+ACCOUNTS = ("401k-a", "brokerage")
+
+
+def _example(tips: bool) -> scenario_file.ScenarioTemplate:
+    with open("scenario_files/example.toml", "rb") as f:
+        data = tomllib.load(f)
+    if tips:
+        data["asset_classes"] = {"tips": {"file": "inflation.csv", "default_rate": data["inflation_rate"]}}
+    for entry in data["accounts"]:
+        if entry["name"] in ACCOUNTS:
+            if tips:
+                entry["allocation"] = {"tips": 1.0}
+            else:
+                entry["growth"] = "inflation"
+    return scenario_file.compile_scenario(data)
+
+
+def _run(scenario) -> tuple:
+    manager, expenses, start_year = scenario
+    simulation = Simulation(manager, expenses, start_year)
+    simulation.run()
+    return simulation.failure_year, manager.balances()
+
+
+def test_file_asset_class_replays_the_start_year():
+    tips, inflation = _example(True), _example(False)
+    for year in (1929, 1966, 2000):
+        assert _run(tips(year)) == _run(inflation(year))
+
+
+def test_batch_passes_file_asset_classes():
+    tips, inflation = _example(True), _example(False)
+    results = batch.run_templates([tips, tips], 1966, scales=[0.8, 1.2])
+    for result, scale in zip(results, (0.8, 1.2)):
+        manager, expenses, start_year = inflation(1966)
+        expenses.scale(scale)
+        simulation = Simulation(manager, expenses, start_year)
+        simulation.run()
+        assert (result.failure_year, result.balances) == (simulation.failure_year, manager.balances())
+
+
+def test_monte_carlo_bootstraps_file_asset_classes_with_the_path():
+    tips = monte_carlo.run(_example(True).on_path, paths=200, seed=3, batch_size=100)
+    inflation = monte_carlo.run(_example(False).on_path, paths=200, seed=3, batch_size=100)
+    assert (tips.successes, tips.failure_years) == (inflation.successes, inflation.failure_years)
+    assert 0 < tips.successes < 200
@@ -0,0 +1,25 @@
+import pytest
+
+import batch
+import scenario_file
+from simulation import Simulation
+
+SCALES = [0.5 + i / 10 for i in range(10)]
+
+
+@pytest.mark.parametrize("annual", [False, True])
+def test_batch_matches_simulating_one_by_one(annual):
+    template = scenario_file.load("scenario_files/example.toml")
+    batched = batch.run_templates([template] * len(SCALES), 1966, annual=annual, scales=SCALES)
+
+    failures = 0
+    for result, scale in zip(batched, SCALES):
+        manager, expenses, start_year = template(1966)
+        expenses.scale(scale)
+        simulation = Simulation(manager, expenses, start_year, annual=annual)
+        simulation.run()
+        assert result.failure_year == simulation.failure_year
+        assert result.balances == manager.balances()
+        failures += simulation.failure_year is not None
+    # portfolios dropping out part way has to be covered too
+    assert 0 < failures < len(SCALES)
@@ -0,0 +1,25 @@
+import tomllib
+
+import scenario_file
+from simulation import Simulation
+
+
+def _example(conversion_tax_percent: float) -> scenario_file.ScenarioTemplate:
+    with open("scenario_files/example.toml", "rb") as f:
+        data = tomllib.load(f)
+    data["strategy"]["conversion_tax_percent"] = conversion_tax_percent
+    return scenario_file.compile_scenario(data)
+
+
+def test_conversions_after_a_down_market_never_owe_negative_taxes():
+    # starting in 1929 the brokerage account sells below its basis while
+    # conversions push income past the 0% cap gains bracket
+    for conversion_tax_percent in (0.12, 0.22):
+        manager, expenses, start_year = _example(conversion_tax_percent)(1929)
+        simulation = Simulation(manager, expenses, start_year)
+        simulation.run()
+
+        for year in range(start_year, simulation.year):
+            taxes = manager.taxes(year)
+            assert taxes.cap_gains_taxes >= 0.0
+            assert taxes.total() >= 0.0
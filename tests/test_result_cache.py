@@ -0,0 +1,34 @@
+import tomllib
+
+import result_cache
+import scenario_file
+
+
+def _example(conversion_tax_percent: float = 0.0) -> scenario_file.ScenarioTemplate:
+    with open("scenario_files/example.toml", "rb") as f:
+        data = tomllib.load(f)
+    data["strategy"]["conversion_tax_percent"] = conversion_tax_percent
+    return scenario_file.compile_scenario(data)
+
+
+def test_second_run_is_a_hit_with_the_same_results(tmp_path):
+    template = _example()
+    with result_cache.ResultCache(str(tmp_path / "cache.sqlite")) as cache:
+        first = cache.run(template, 1966)
+        second = cache.run(template, 1966)
+        assert (cache.hits, cache.misses) == (1, 1)
+    assert second == first
+    assert second == result_cache.simulate(template, 1966)
+
+
+def test_changed_scenario_options_or_engine_version_miss(tmp_path, monkeypatch):
+    with result_cache.ResultCache(str(tmp_path / "cache.sqlite")) as cache:
+        cache.run(_example(), 1966)
+        cache.run(_example(0.12), 1966)
+        assert (cache.hits, cache.misses) == (0, 2)
+        cache.run(_example(), 1966, annual=True)
+        assert (cache.hits, cache.misses) == (0, 3)
+
+        monkeypatch.setattr(result_cache, "ENGINE_VERSION", result_cache.ENGINE_VERSION + 1)
+        cache.run(_example(), 1966)
+        assert (cache.hits, cache.misses) == (0, 4)
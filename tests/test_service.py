@@ -0,0 +1,29 @@
+import asyncio
+import json
+
+import service
+
+
+async def _request(raw: bytes) -> bytes:
+    app = service.SweepService(max_workers=1)
+    await app.start()
+    server = await asyncio.start_server(app.handle, "127.0.0.1", 0)
+    try:
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        writer.write_eof()
+        response = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+        return response
+    finally:
+        server.close()
+        await server.wait_closed()
+        app.close()
+
+
+def test_body_shorter_than_content_length_is_a_bad_request():
+    response = asyncio.run(_request(b"POST /simulate HTTP/1.1\r\nContent-Length: 100\r\n\r\n{\"scenario\": {}}"))
+    head, _, body = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 400")
+    assert json.loads(body) == {"error": "body ended after 16 of 100 bytes"}
@@ -0,0 +1,27 @@
+import scenario_file
+import solver
+from simulation import OUT_OF_MONEY
+from simulation import PENSION_OVER_INCOME
+from simulation import Simulation
+
+EXAMPLE = "scenario_files/example.toml"
+
+
+def _run(template, start_historic_year: int, scale: float) -> Simulation:
+    manager, expenses, start_year = template(start_historic_year)
+    expenses.scale(scale)
+    simulation = Simulation(manager, expenses, start_year)
+    simulation.run()
+    return simulation
+
+
+def test_pensions_covering_spending_counts_as_surviving():
+    # at half the spending 1928 lasts until the pensions pay for everything
+    template = scenario_file.load(EXAMPLE)
+    assert _run(template, 1928, 0.5).failure_reason == PENSION_OVER_INCOME
+
+    result = solver.max_expenses(template, 1928)
+
+    assert result.scale > 0.5
+    assert _run(template, 1928, result.scale).failure_reason in (None, PENSION_OVER_INCOME)
+    assert _run(template, 1928, result.scale * 1.01).failure_reason == OUT_OF_MONEY
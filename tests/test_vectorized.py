@@ -0,0 +1,25 @@
+import pytest
+
+import scenario_file
+import vectorized
+from simulation import Simulation
+
+YEARS = range(1960, 2025)
+
+
+def test_vectorized_matches_object_model():
+    template = scenario_file.load("scenario_files/example.toml")
+    results = vectorized.sweep(template, YEARS).results
+
+    assert len(results) == len(YEARS)
+    for year, result in zip(YEARS, results):
+        manager, expenses, start_year = template(year)
+        simulation = Simulation(manager, expenses, start_year)
+        simulation.run()
+        assert result.failure_year == simulation.failure_year, year
+        assert result.balances == pytest.approx(manager.balances(), rel=1e-9, abs=1e-6), year
+
+
+def test_compare_with_object_model_reports_no_mismatches():
+    template = scenario_file.load("scenario_files/example.toml")
+    assert vectorized.compare_with_object_model(template, YEARS) == []
@@ -0,0 +1,83 @@
+import contextlib
+import json
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+# Structured trace of withdrawal decisions. Call sites check `tracing.sink is not None`
+# before building anything, so without a sink attached tracing costs one attribute
+# lookup. Events are plain dicts of numbers:
+#   {"event": "rmd", "group": "401ks", "account": None, "year": 2045, "withdraw_amount": 1234.5, ...}
+# Tracing is per process, simulations on a process pool are not traced.
+
+sink = None
+
+
+class TraceSink(object):
+    """
+    Keeps the events of the given accounts (group or account names) and years, all when None.
+    """
+
+    def __init__(self, accounts: Iterable[str] = None, years: Iterable[int] = None):
+        self.accounts = None if accounts is None else set(accounts)
+        self.years = None if years is None else set(years)
+
+    def accepts(self, group: str, account: Optional[str], year: int) -> bool:
+        if self.years is not None and year not in self.years:
+            return False
+        if self.accounts is not None and group not in self.accounts and account not in self.accounts:
+            return False
+        return True
+
+    def record(self, event: dict):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemorySink(TraceSink):
+    def __init__(self, accounts: Iterable[str] = None, years: Iterable[int] = None):
+        super().__init__(accounts, years)
+        self.events: List[dict] = []
+
+    def record(self, event: dict):
+        self.events.append(event)
+
+
+class JsonlSink(TraceSink):
+    def __init__(self, file_name: str, accounts: Iterable[str] = None, years: Iterable[int] = None):
+        super().__init__(accounts, years)
+        self._file = open(file_name, "w")
+
+    def record(self, event: dict):
+        self._file.write(json.dumps(event) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+class PrintSink(TraceSink):
+    def record(self, event: dict):
+        output = f"({event['year']}) {event['event']} {event['account'] or event['group']}"
+        for key, value in event.items():
+            if key not in ("event", "group", "account", "year"):
+                output += f" {key}: {value:,.2f}"
+        print(output)
+
+
+def emit(event: str, group: str, account: Optional[str], year: int, **fields):
+    if sink.accepts(group, account, year):
+        sink.record({"event": event, "group": group, "account": account, "year": year, **fields})
+
+
+@contextlib.contextmanager
+def attached(trace_sink: TraceSink):
+    global sink
+    previous = sink
+    sink = trace_sink
+    try:
+        yield trace_sink
+    finally:
+        sink = previous
+        trace_sink.close()
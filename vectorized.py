@@ -0,0 +1,535 @@
+import argparse
+from typing import Callable
+from typing import Iterable
+from typing import List
+from typing import Tuple
+
+import numpy as np
+
+import account
+import income
+import tax_bracket
+from simulation import END_YEAR
+from simulation import Simulation
+from simulation import SimulationResult
+from sweep import FIRST_HISTORIC_YEAR
+from sweep import LAST_HISTORIC_YEAR
+from sweep import SweepResult
+from sweep import load_scenario
+from yearly_withdraw_manager import Expenses
+from yearly_withdraw_manager import YearlyWithdrawManager
+
+# Vectorized alternative to Simulation. All scenarios handed to VectorizedSimulation
+# must share the same account layout (same factory, different rate paths).
+# Everything that only depends on the rate path (expenses, brackets, deductions,
+# pensions, growth rates) is precomputed by replaying the scenario's own objects,
+# so only the balance dependent work is stepped as (scenarios, accounts) arrays.
+# Every scenario's income tax brackets are the same base brackets inflated by some
+# ratio, so a year's income taxes are ratio * taxes on income / ratio of the base
+# brackets, one tax_for_incomes for all scenarios.
+
+Scenario = Tuple[YearlyWithdrawManager, Expenses, int]
+
+_ALWAYS = -(10 ** 9)
+
+
+class _Group(object):
+    def __init__(self, group: account.PostTax401kRateLimit, slots: List[int]):
+        self.name = group.name
+        self.slots = slots
+        self.percent_over_max = None
+        self.max_low = None
+        self.deduction = None
+        self.pension = None
+
+
+class _Layout(object):
+    def __init__(self, manager: YearlyWithdrawManager):
+        self.accounts = []
+        self.cascade = []
+        self.conversion_items = []
+        self.groups = []
+
+        for acc in manager.taxable_accounts + manager.post_tax_accounts + manager.pre_tax_accounts:
+            if isinstance(acc, account.PostTax401kRateLimit):
+                group = _Group(acc, [self._add(sub) for sub in acc.accounts])
+                self.groups.append(group)
+                self.cascade.append(group)
+            else:
+                self.cascade.append(self._add(acc))
+
+        post_tax_items = self.cascade[len(manager.taxable_accounts):][:len(manager.post_tax_accounts)]
+        for acc, item in zip(manager.post_tax_accounts, post_tax_items):
+            if isinstance(acc, account.PostTax401kRateLimit):
+                self.conversion_items.extend(item.slots)
+            elif isinstance(acc, account.PostTax401k):
+                self.conversion_items.append(item)
+            else:
+                raise ValueError(f"{acc.name}: post tax accounts must support conversions")
+
+        self.taxable_slots = []
+        for acc in manager.taxable_accounts:
+            self.taxable_slots.append(self.accounts.index(acc))
+        self.pre_tax_slots = []
+        for acc in manager.pre_tax_accounts:
+            self.pre_tax_slots.append(self.accounts.index(acc))
+
+        self.names = [acc.name for acc in self.accounts]
+        self.is_basis = np.array([isinstance(acc, account.TaxableWithBasis) for acc in self.accounts])
+        self.is_taxable = np.array([type(acc) is account.Taxable for acc in self.accounts])
+        self.is_traditional = np.array([isinstance(acc, account.PostTax401k) for acc in self.accounts])
+
+        for pension in manager.pension_accounts:
+            if not isinstance(pension, income.FixedPensionIncome):
+                raise ValueError(f"{pension.name}: only fixed pension incomes can be vectorized")
+
+        self.signature = self._signature(manager)
+
+    def _add(self, acc) -> int:
+        if not isinstance(acc, (account.Account, account.TaxableWithBasis)):
+            raise ValueError(f"{acc.name}: unsupported account type {type(acc).__name__}")
+        self.accounts.append(acc)
+        return len(self.accounts) - 1
+
+    @staticmethod
+    def _signature(manager: YearlyWithdrawManager):
+        def describe(accounts):
+            output = []
+            for acc in accounts:
+                subs = tuple(describe(acc.accounts)) if isinstance(acc, account.PostTax401kRateLimit) else ()
+                output.append((type(acc).__name__, acc.name, subs))
+            return output
+
+        return (tuple(describe(manager.taxable_accounts)),
+                tuple(describe(manager.post_tax_accounts)),
+                tuple(describe(manager.pre_tax_accounts)),
+                tuple((type(p).__name__, p.name) for p in manager.pension_accounts),
+                len(manager.income_tax_brackets.brackets))
+
+
+class VectorizedSimulation(object):
+    def __init__(self, scenarios: List[Scenario], end_year: int = END_YEAR):
+        if not scenarios:
+            raise ValueError("at least one scenario is required")
+        manager, _, start_year = scenarios[0]
+        self.layout = _Layout(manager)
+        self.start_year = start_year
+        self.end_year = end_year
+        self.years = end_year - start_year + 1
+        for other_manager, _, other_start_year in scenarios[1:]:
+            if other_start_year != start_year or _Layout._signature(other_manager) != self.layout.signature:
+                raise ValueError("all scenarios must have the same accounts and start year")
+
+        count = len(scenarios)
+        slots = len(self.layout.accounts)
+        # column major, so each account's balances over all scenarios are contiguous
+        self.amount = np.zeros((count, slots), order="F")
+        self.gains = np.zeros((count, slots), order="F")
+        self.withdrawn = np.zeros((count, slots), order="F")
+        self.rmd = np.zeros((count, slots))
+        self.start_date = np.zeros((count, slots), dtype=np.int64)
+        self.eligible_from = np.full((count, slots), _ALWAYS, dtype=np.int64)
+        self.rmd_factor = np.zeros((count, self.years, slots))
+        self.growth = np.zeros((count, self.years, slots))
+        self.catch_up = np.ones((count, slots), order="F")
+
+        self.expenses = np.zeros((count, self.years))
+        self.pension_payment = np.zeros((count, self.years))
+        self.pension_taxable = np.zeros((len(manager.pension_accounts), count, self.years))
+        self.deduction = np.zeros((count, self.years))
+        self.conversion_ceiling = np.zeros((count, self.years))
+        brackets = manager.income_tax_brackets
+        self.base_income_brackets = tax_bracket.TaxBracketCollection(
+            [tax_bracket.TaxBracket(max_income, bracket.percentage)
+             for max_income, bracket in zip(brackets._base_max_incomes, brackets.brackets)], brackets.base_year, {})
+        self.income_ratio = np.ones((count, self.years))
+        self.cap_gains_limit = np.zeros((count, self.years))
+        self.cap_gains_percentage = np.zeros((count, self.years))
+        self.lump_sums = [[] for _ in range(self.years)]
+        for group in self.layout.groups:
+            group.max_low = np.zeros((count, self.years))
+            group.deduction = np.zeros((count, self.years))
+            group.pension = np.zeros((count, self.years))
+            group.percent_over_max = np.zeros(count)
+
+        for s, scenario in enumerate(scenarios):
+            self._compile(s, scenario)
+        self._latest_start_date = int(self.start_date.max())
+        self._eligible = [None] * slots
+
+        self.failure_year = np.zeros(count, dtype=np.int64)
+        self.alive = np.ones(count, dtype=bool)
+        self.ending_amount = None
+        self.ending_gains = None
+
+    def _compile(self, s: int, scenario: Scenario):
+        manager, expenses, start_year = scenario
+        accounts = _Layout(manager).accounts
+        base = self.base_income_brackets
+        if manager.income_tax_brackets._base_max_incomes != base.thresholds or \
+                [b.percentage for b in manager.income_tax_brackets.brackets] != [b.percentage for b in base.brackets]:
+            raise ValueError("scenarios must start from the same income tax brackets")
+        for i, acc in enumerate(accounts):
+            if isinstance(acc, account.TaxableWithBasis):
+                self.amount[s, i] = acc.amount_basis
+                self.gains[s, i] = acc.amount_gains
+            else:
+                self.amount[s, i] = acc.amount
+            self.start_date[s, i] = acc.date
+            self.catch_up[s, i] = account._growth_factor(acc._inflate_percent, acc.date, start_year * 12)
+            if isinstance(acc, account.PreTax401k):
+                self.eligible_from[s, i] = acc.min_year
+            elif isinstance(acc, account.PostTax401k):
+                self.eligible_from[s, i] = acc.born_year + acc.min_age
+
+        traditional = [(i, acc.born_year) for i, acc in enumerate(accounts) if isinstance(acc, account.PostTax401k)]
+        groups = [acc for acc in manager.post_tax_accounts if isinstance(acc, account.PostTax401kRateLimit)]
+        lump_sums = manager._lump_sum_payments
+        growth = []
+        rmd_factor = []
+        expense_amounts = []
+        deductions = []
+        conversion_ceilings = []
+        income_ratios = []
+        cap_gains = []
+        group_rows = [[] for _ in groups]
+        pension_payments = []
+        pension_taxable = []
+        for y in range(self.years):
+            year = start_year + y
+            growth.append([account._monthly_growth_factor(acc._inflate_percent(year)) for acc in accounts])
+            factor_row = [0.0] * len(accounts)
+            for i, born_year in traditional:
+                if year - born_year >= account.RMD.start_age:
+                    factor_row[i] = account.RMD._get_factor(year - born_year)
+            rmd_factor.append(factor_row)
+
+            expenses.inflate(year)
+            manager.inflate(year)
+            manager.set_total_predicted_income_taxes(year)
+            expense_amounts.append(expenses.amount(year))
+            deductions.append(manager.standard_deductions.amount)
+            conversion_ceilings.append(manager.conversion_ceiling())
+            income_ratios.append(manager.income_tax_brackets.thresholds[0] / base.thresholds[0])
+            cap_gains_brackets = manager.cap_gains_tax_brackets.brackets
+            cap_gains.append((cap_gains_brackets[0].max_income, cap_gains_brackets[1].percentage))
+            for group, rows in zip(groups, group_rows):
+                rows.append((group._max_low_tax_bracket(), group.standard_deductions.amount,
+                             group.pension_payment_by_year.get(year, 0)))
+
+            payment = 0
+            for pension in manager.pension_accounts:
+                payment += pension.payment(year)
+            for month in range(2, 13):
+                for pension in manager.pension_accounts:
+                    pension.payment(year)
+            pension_payments.append(payment)
+            pension_taxable.append([pension.taxable_income(year) for pension in manager.pension_accounts])
+
+            k = 0
+            for lump_sum in lump_sums:
+                if lump_sum.year == year:
+                    if k == len(self.lump_sums[y]):
+                        self.lump_sums[y].append(np.zeros(len(self.amount)))
+                    self.lump_sums[y][k][s] = lump_sum.amount
+                    k += 1
+
+        self.growth[s] = growth
+        self.rmd_factor[s] = rmd_factor
+        self.expenses[s] = expense_amounts
+        self.deduction[s] = deductions
+        self.conversion_ceiling[s] = conversion_ceilings
+        self.income_ratio[s] = income_ratios
+        self.cap_gains_limit[s], self.cap_gains_percentage[s] = np.array(cap_gains).T
+        for vector_group, group, rows in zip(self.layout.groups, groups, group_rows):
+            vector_group.max_low[s], vector_group.deduction[s], vector_group.pension[s] = np.array(rows).T
+            vector_group.percent_over_max[s] = group.percent_over_max
+        self.pension_payment[s] = pension_payments
+        if manager.pension_accounts:
+            self.pension_taxable[:, s] = np.array(pension_taxable).T
+
+    def run(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            taxes = np.zeros(len(self.amount))
+            for y in range(self.years):
+                if not self.alive.any():
+                    break
+                taxes = self._step(y, taxes)
+
+        self._record_failure(self.alive)
+        return self.failure_year
+
+    def results(self, start_historic_years: Iterable[int]) -> List[SimulationResult]:
+        output = []
+        total = self.ending_amount + self.ending_gains
+        for s, start_historic_year in enumerate(start_historic_years):
+            balances = {}
+            for i, name in enumerate(self.layout.names):
+                balances[name] = float(total[s, i])
+            failure_year = int(self.failure_year[s]) if self.failure_year[s] else None
+            output.append(SimulationResult(start_historic_year, failure_year, balances))
+        return output
+
+    def _step(self, y: int, taxes: np.ndarray) -> np.ndarray:
+        year = self.start_year + y
+        self.withdrawn[:] = 0.0
+        self._rmd_year = None
+        for i in range(len(self.layout.accounts)):
+            eligible = year >= self.eligible_from[:, i]
+            self._eligible[i] = None if eligible.all() else eligible
+
+        # jan 1st
+        yearly_income = self.expenses[:, y]
+        self._withdraw(taxes, y)
+        for month in range(1, 13):
+            monthly_income = yearly_income / 12
+            self._increase(y, year * 12 + (month - 1))
+            monthly_income = monthly_income - self.pension_payment[:, y]
+            failed = self.alive & (monthly_income < 0)
+            self._fail(failed, year)
+            monthly_left_over = self._withdraw(monthly_income, y)
+            self._fail(self.alive & (monthly_left_over > 0), year)
+
+        self._conversions(y)
+        for amount in self.lump_sums[y]:
+            self._add(self.layout.taxable_slots[0], amount, y)
+        return self._taxes(y)
+
+    def _fail(self, failed: np.ndarray, year: int):
+        if failed.any():
+            self._record_failure(failed)
+            self.failure_year[failed] = year
+            self.alive &= ~failed
+
+    def _record_failure(self, mask: np.ndarray):
+        if self.ending_amount is None:
+            self.ending_amount = self.amount.copy()
+            self.ending_gains = self.gains.copy()
+        self.ending_amount[mask] = self.amount[mask]
+        self.ending_gains[mask] = self.gains[mask]
+
+    def _increase(self, y: int, date: int):
+        if date == self.start_year * 12:
+            growth = self.catch_up
+        else:
+            growth = self.growth[:, y, :]
+            if date <= self._latest_start_date:
+                growth = np.where(self.start_date < date, growth, 1.0)
+        np.add(self.gains, (self.amount + self.gains) * (growth - 1.0), out=self.gains, where=self.layout.is_basis)
+        np.multiply(self.amount, growth, out=self.amount, where=~self.layout.is_basis)
+
+    def _take(self, i: int, amount: np.ndarray, y: int, mask=None, eligible: bool = True) -> np.ndarray:
+        if eligible and self._eligible[i] is not None:
+            mask = self._eligible[i] if mask is None else mask & self._eligible[i]
+
+        withdrawn = self.withdrawn[:, i]
+        if self.layout.is_basis[i]:
+            basis = self.amount[:, i]
+            gains = self.gains[:, i]
+            total = basis + gains
+            over = (amount > total) | (total <= 0.0)
+            left_over = np.where(over, amount - total, 0.0)
+            percentage_gains = gains / (basis + gains)
+            new_gains = np.where(over, 0.0, gains - percentage_gains * amount)
+            new_basis = np.where(over, 0.0, basis - (1 - percentage_gains) * amount)
+            if mask is not None:
+                new_gains = np.where(mask, new_gains, gains)
+                new_basis = np.where(mask, new_basis, basis)
+            self.gains[:, i] = new_gains
+            self.amount[:, i] = new_basis
+        else:
+            balance = self.amount[:, i]
+            left_over = np.maximum(amount - balance, 0.0)
+            new_balance = np.maximum(balance - amount, 0.0)
+            if mask is not None:
+                new_balance = np.where(mask, new_balance, balance)
+            self.amount[:, i] = new_balance
+
+        new_withdrawn = (amount - left_over) + withdrawn
+        if mask is not None:
+            new_withdrawn = np.where(mask, new_withdrawn, withdrawn)
+            left_over = np.where(mask, left_over, amount)
+        self.withdrawn[:, i] = new_withdrawn
+        return left_over
+
+    def _add(self, i: int, amount: np.ndarray, y: int, mask=None):
+        withdrawn = self.withdrawn[:, i]
+        new_amount = self.amount[:, i] + amount
+        new_withdrawn = np.where(withdrawn - amount <= 0, 0.0, withdrawn - amount)
+        if mask is not None:
+            new_amount = np.where(mask, new_amount, self.amount[:, i])
+            new_withdrawn = np.where(mask, new_withdrawn, withdrawn)
+        self.amount[:, i] = new_amount
+        self.withdrawn[:, i] = new_withdrawn
+
+    def _withdraw(self, amount: np.ndarray, y: int) -> np.ndarray:
+        for item in self.layout.cascade:
+            if isinstance(item, _Group):
+                amount = self._withdraw_group(item, amount, y)
+            else:
+                amount = self._take(item, amount, y)
+        return amount
+
+    def _required_yearly_withdraw(self, y: int):
+        if self._rmd_year != y:
+            self._rmd_year = y
+            factor = self.rmd_factor[:, y, :]
+            self.rmd = np.where(factor > 0, self.amount / np.where(factor > 0, factor, 1.0), 0.0)
+
+    def _withdraw_group(self, group: _Group, amount: np.ndarray, y: int) -> np.ndarray:
+        self._required_yearly_withdraw(y)
+        already_withdraw = 0
+        for i in group.slots:
+            already_withdraw = already_withdraw + self.withdrawn[:, i]
+        max_amount_to_withdraw = group.max_low[:, y] + group.deduction[:, y]
+        max_amount_to_withdraw = max_amount_to_withdraw * (1 + group.percent_over_max)
+        total_taxable_income = already_withdraw + group.pension[:, y]
+
+        left_over = self._withdraw_rmd(group, amount, already_withdraw, y)
+
+        total_taxable_income = total_taxable_income + (amount - left_over)
+
+        under = total_taxable_income + left_over < max_amount_to_withdraw
+        can_withdraw = np.minimum(np.maximum(max_amount_to_withdraw - total_taxable_income, 0), left_over)
+        can_withdraw = np.where(under, left_over, can_withdraw)
+        amount_left = can_withdraw
+        for i in group.slots:
+            amount_left = self._take(i, amount_left, y)
+        return np.where(under, amount_left, amount_left + (left_over - can_withdraw))
+
+    def _withdraw_rmd(self, group: _Group, amount: np.ndarray, already_withdraw: np.ndarray,
+                      y: int) -> np.ndarray:
+        required_yearly_withdraw = 0
+        for i in group.slots:
+            required_yearly_withdraw = required_yearly_withdraw + self.rmd[:, i]
+        required = required_yearly_withdraw > 0.0
+        if not required.any():
+            return amount
+
+        can_withdraw = np.minimum(np.maximum(required_yearly_withdraw - already_withdraw, 0), amount)
+        amount_left = can_withdraw
+        for i in group.slots:
+            withdraw_by_year = np.maximum(self.withdrawn[:, i], 0.0)
+            behind = required & (self.rmd[:, i] > withdraw_by_year)
+            required_amount_left = self.rmd[:, i] - withdraw_by_year
+            more = amount_left > required_amount_left
+            w = np.where(more, required_amount_left, amount_left)
+            left = self._take(i, w, y, mask=behind)
+            left = np.where(more, left + (amount_left - required_amount_left), left)
+            amount_left = np.where(behind, left, amount_left)
+        return np.where(required, amount_left + (amount - can_withdraw), amount)
+
+    def _total_taxable_income(self, y: int) -> np.ndarray:
+        amount = np.zeros(len(self.amount))
+        for item in self.layout.cascade:
+            if isinstance(item, _Group):
+                total = 0
+                for i in item.slots:
+                    total = total + np.maximum(self.withdrawn[:, i], 0.0)
+                amount = amount + total
+            elif self.layout.is_traditional[item]:
+                amount = amount + np.maximum(self.withdrawn[:, item], 0.0)
+        for taxable in self.pension_taxable:
+            amount = amount + taxable[:, y]
+        return amount
+
+    def _total_cap_gains(self) -> np.ndarray:
+        amount = np.zeros(len(self.amount))
+        for item in self.layout.cascade:
+            if isinstance(item, _Group):
+                continue
+            withdraw_by_year = np.maximum(self.withdrawn[:, item], 0.0)
+            if self.layout.is_taxable[item]:
+                amount = amount + withdraw_by_year * 0.60
+            elif self.layout.is_basis[item]:
+                basis = self.amount[:, item]
+                gains = self.gains[:, item]
+                has_gains = (withdraw_by_year > 0) & (basis + gains > 0)
+                amount = amount + np.where(has_gains, withdraw_by_year * (gains / (basis + gains)), 0)
+        return np.maximum(amount, 0.0)
+
+    def _conversions(self, y: int):
+        taxable_income = self._total_taxable_income(y)
+        ceiling = self.conversion_ceiling[:, y]
+        convert = taxable_income < ceiling
+        if not convert.any():
+            return
+        amount_to_convert = ceiling - taxable_income
+        for i in self.layout.conversion_items:
+            amount_to_convert = self._take(i, amount_to_convert, y, mask=convert, eligible=False)
+        self._add(self.layout.pre_tax_slots[0], ceiling - taxable_income - amount_to_convert, y, mask=convert)
+
+    def _taxes(self, y: int) -> np.ndarray:
+        taxable_income = self._total_taxable_income(y)
+        cap_gains = self._total_cap_gains()
+
+        after_deductions = taxable_income - self.deduction[:, y]
+        ratio = self.income_ratio[:, y]
+        income_taxes = ratio * self.base_income_brackets.tax_for_incomes(after_deductions / ratio)
+
+        limit = self.cap_gains_limit[:, y]
+        percentage = self.cap_gains_percentage[:, y]
+        cap_under_first_bracket = np.minimum(limit - taxable_income, cap_gains)
+        cap_gains_taxes = np.where(taxable_income > limit,
+                                   cap_gains * percentage,
+                                   (cap_gains - cap_under_first_bracket) * percentage)
+        return cap_gains_taxes + income_taxes
+
+
+def sweep(scenario: Callable,
+          start_historic_years: Iterable[int] = range(FIRST_HISTORIC_YEAR, LAST_HISTORIC_YEAR + 1),
+          end_year: int = END_YEAR) -> SweepResult:
+    years = list(start_historic_years)
+    simulation = VectorizedSimulation([scenario(year) for year in years], end_year)
+    simulation.run()
+    return SweepResult(simulation.results(years))
+
+
+def compare_with_object_model(scenario: Callable,
+                              start_historic_years: Iterable[int] = range(FIRST_HISTORIC_YEAR,
+                                                                          LAST_HISTORIC_YEAR + 1),
+                              end_year: int = END_YEAR,
+                              rtol: float = 1e-9) -> List[str]:
+    """
+    Parity check against Simulation. Returns a list of mismatches, empty when the engines agree.
+    """
+    years = list(start_historic_years)
+    vectorized = sweep(scenario, years, end_year).results
+    mismatches = []
+    for year, result in zip(years, vectorized):
+        manager, expenses, start_year = scenario(year)
+        simulation = Simulation(manager, expenses, start_year, end_year)
+        simulation.run()
+        expected = simulation.result(year)
+        if expected.failure_year != result.failure_year:
+            mismatches.append(f"{year}: failure year {expected.failure_year} != {result.failure_year}")
+            continue
+        for name, balance in expected.balances.items():
+            if abs(balance - result.balances[name]) > rtol * max(abs(balance), 1.0):
+                mismatches.append(f"{year}: {name} ${balance:,.2f} != ${result.balances[name]:,.2f}")
+    return mismatches
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Run a scenario for every historical start year with numpy.")
+    parser.add_argument("--scenario", default="scenario_files/example.toml")
+    parser.add_argument("--first-year", type=int, default=FIRST_HISTORIC_YEAR)
+    parser.add_argument("--last-year", type=int, default=LAST_HISTORIC_YEAR)
+    parser.add_argument("--end-year", type=int, default=END_YEAR)
+    parser.add_argument("--check", action="store_true", help="compare against the object model instead")
+    args = parser.parse_args(argv)
+
+    scenario = load_scenario(args.scenario)
+    years = range(args.first_year, args.last_year + 1)
+    if not args.check:
+        print(sweep(scenario, years, args.end_year).summary())
+        return
+
+    mismatches = compare_with_object_model(scenario, years, args.end_year)
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f"{len(mismatches)} mismatches")
+
+
+if __name__ == "__main__":
+    main()
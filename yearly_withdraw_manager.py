@@ -1,26 +1,50 @@
+import functools
 import account
+import inflation_index
+import results
 import tax_bracket
 import income
 import tax_deductions
+import tracing
 
+from typing import Callable
 from typing import List
-from typing import Tuple
 from typing import Dict
+from typing import Optional
+
+from ledger import YearTable
 
 
 class Expense(object):
     def __init__(self, initial_expense: float, year: int):
         self._amount = initial_expense
         self._year = year
+        self._base_amount = initial_expense
+        self._base_year = year
 
-    def inflate(self, year: int, inflate_percent: float):
-        while self._year < year:
-            self._amount *= (1.0 + inflate_percent)
-            self._year += 1
+    def inflate(self, year: int, index: inflation_index.InflationIndex):
+        if self._year < year:
+            self._amount = self._base_amount * index.ratio(self._base_year, year)
+            self._year = year
 
     def amount(self, year: int) -> float:
         return self._amount
 
+    def projected_amount(self, year: int, index: inflation_index.InflationIndex) -> float:
+        if year <= self._year:
+            return self._amount
+        return self._base_amount * index.ratio(self._base_year, year)
+
+    def scale(self, factor: float):
+        self._amount *= factor
+        self._base_amount *= factor
+
+    def snapshot(self) -> tuple:
+        return self._amount, self._year, self._base_amount
+
+    def restore(self, state: tuple):
+        self._amount, self._year, self._base_amount = state
+
 
 class HousingExpense(Expense):
     def __init__(self, initial_expense: float, year: int, end_payments_year: int,
@@ -29,7 +53,7 @@ class HousingExpense(Expense):
         self._payed_off_year = end_payments_year
         self._start_payments_year = start_payments_year
 
-    def inflate(self, year: int, inflate_percent: float):
+    def inflate(self, year: int, index: inflation_index.InflationIndex):
         self._year = year
 
     def amount(self, year: int) -> float:
@@ -38,6 +62,9 @@ class HousingExpense(Expense):
             a = super().amount(year)
         return a
 
+    def projected_amount(self, year: int, index: inflation_index.InflationIndex) -> float:
+        return self.amount(year)
+
 
 class EndingExpense(Expense):
     def __init__(self, initial_expense: float, year: int, end_year):
@@ -50,22 +77,26 @@ class EndingExpense(Expense):
         else:
             return super().amount(year)
 
+    def projected_amount(self, year: int, index: inflation_index.InflationIndex) -> float:
+        if year >= self._end_year:
+            return 0.0
+        return super().projected_amount(year, index)
+
 
 class Expenses(object):
     def __init__(self, expenses: [Expense], inflate_percent: float):
         self.expenses = expenses
         self.inflate_percent = inflate_percent
         self.inflate_percent_by_year = {}
+        self.inflation_index = inflation_index.get(self.inflate_percent_by_year, inflate_percent)
 
     def inflate(self, year: int):
         for expense in self.expenses:
-            expense.inflate(year, self._inflate_percent(year))
+            expense.inflate(year, self.inflation_index)
 
     def set_inflate_percent_by_year(self, inflate_percent_by_year):
         self.inflate_percent_by_year = inflate_percent_by_year
-
-    def _inflate_percent(self, year):
-        return self.inflate_percent_by_year.get(year, self.inflate_percent)
+        self.inflation_index = inflation_index.get(inflate_percent_by_year, self.inflate_percent)
 
     def amount(self, year) -> float:
         total = 0.0
@@ -73,6 +104,23 @@ class Expenses(object):
             total += expense.amount(year)
         return total
 
+    def projected_amount(self, year) -> float:
+        total = 0.0
+        for expense in self.expenses:
+            total += expense.projected_amount(year, self.inflation_index)
+        return total
+
+    def scale(self, factor: float):
+        for expense in self.expenses:
+            expense.scale(factor)
+
+    def snapshot(self) -> tuple:
+        return [expense.snapshot() for expense in self.expenses]
+
+    def restore(self, state: tuple):
+        for expense, expense_state in zip(self.expenses, state):
+            expense.restore(expense_state)
+
 
 class YearlyTaxBracket(object):
     def __init__(self, bracket: tax_bracket.TaxBracket, amount_paid: float):
@@ -81,26 +129,93 @@ class YearlyTaxBracket(object):
 
 
 class YearlyTaxes:
-    def __init__(self, cap_gains_taxes: float, income_taxes: float, income_brackets: List[YearlyTaxBracket]):
+    def __init__(self, cap_gains_taxes: float, income_taxes: float, income_brackets: List[YearlyTaxBracket] = None,
+                 build_income_brackets: Callable[[], List[YearlyTaxBracket]] = None):
         self.cap_gains_taxes = cap_gains_taxes
         self.income_taxes = income_taxes
-        self.income_brackets = income_brackets
+        self._income_brackets = income_brackets
+        self._build_income_brackets = build_income_brackets
+
+    @property
+    def income_brackets(self) -> List[YearlyTaxBracket]:
+        # only the csv output needs the per bracket break down
+        if self._income_brackets is None:
+            self._income_brackets = self._build_income_brackets() if self._build_income_brackets else []
+        return self._income_brackets
 
     def total(self) -> float:
         return self.cap_gains_taxes + self.income_taxes
 
     @staticmethod
-    def csv_header(income_tax_brackets: List[tax_bracket.TaxBracket]) -> str:
-        output = ""
+    def row_header(income_tax_brackets: List[tax_bracket.TaxBracket]) -> List[results.Column]:
+        output = [results.Column("cap taxes", results.MONEY),
+                  results.Column("income taxes", results.MONEY),
+                  results.Column("total taxes", results.MONEY)]
         for bracket in income_tax_brackets:
-            output += f";{bracket.percentage};amount"
-        return ";cap taxes;income taxes;total taxes" + output
+            output.append(results.Column(f"{bracket.percentage}", results.MONEY))
+            output.append(results.Column("amount", results.MONEY))
+        return output
 
-    def csv(self) -> str:
-        output = ""
+    def row_values(self) -> List[float]:
+        output = [self.cap_gains_taxes, self.income_taxes, self.total()]
         for yearly_bracket in self.income_brackets:
-            output += f";${yearly_bracket.bracket.max_income:,.2f};${yearly_bracket.amount_paid:,.2f}"
-        return f";${self.cap_gains_taxes:,.2f};${self.income_taxes:,.2f};${self.total():,.2f}{output}"
+            output.append(yearly_bracket.bracket.max_income)
+            output.append(yearly_bracket.amount_paid)
+        return output
+
+    @staticmethod
+    def csv_header(income_tax_brackets: List[tax_bracket.TaxBracket]) -> str:
+        return results.format_header(YearlyTaxes.row_header(income_tax_brackets))
+
+    def csv(self) -> str:
+        values = self.row_values()
+        return results.format_row([results.Column("", results.MONEY)] * len(values), values)
+
+
+class WithdrawPlan(object):
+    """
+    The withdraw cascade, taxable then post tax then pre tax accounts, compiled once
+    for a set of account lists. A year's steps are only the accounts withdraw can take
+    money out of that year, and the cascade stops once the amount is covered, so most
+    withdraws call one or two accounts. Asking an account for nothing has no effect
+    except for account groups, whose first withdraw of a year fixes that year's required
+    withdraws, so the plan fixes them when the year starts instead. With a tracing sink
+    attached every account is asked, as before, so traces are unchanged.
+    """
+
+    def __init__(self, taxable_accounts: list, post_tax_accounts: list, pre_tax_accounts: list):
+        self.sources = (taxable_accounts, post_tax_accounts, pre_tax_accounts)
+        self.accounts = taxable_accounts + post_tax_accounts + pre_tax_accounts
+        self.start_years = [acc.withdraw_start_year() for acc in self.accounts]
+        self.groups = [acc for acc in self.accounts if hasattr(acc, "accounts")]
+        self.year = None
+        self.steps = ()
+
+    def compiled_for(self, taxable_accounts: list, post_tax_accounts: list, pre_tax_accounts: list) -> bool:
+        # the profiler swaps in lists of proxies, the plan is compiled again for those
+        sources = self.sources
+        return sources[0] is taxable_accounts and sources[1] is post_tax_accounts and \
+            sources[2] is pre_tax_accounts
+
+    def _start(self, year: int):
+        self.year = year
+        self.steps = tuple(acc.withdraw for acc, start_year in zip(self.accounts, self.start_years)
+                           if start_year is None or year >= start_year)
+        for group in self.groups:
+            group.required_yearly_withdraw(year)
+
+    def withdraw(self, amount: float, year: int) -> float:
+        if year != self.year:
+            self._start(year)
+        if tracing.sink is not None:
+            for acc in self.accounts:
+                amount = acc.withdraw(amount, year)
+            return amount
+        for withdraw in self.steps:
+            if amount == 0.0:
+                break
+            amount = withdraw(amount, year)
+        return amount
 
 
 class YearlyWithdrawManager:
@@ -115,7 +230,8 @@ class YearlyWithdrawManager:
                  standard_deductions: tax_deductions.StandardDeductions,
                  market_increase_by_year: Dict[int, float],
                  inflation_percent_by_year: Dict[int, float],
-                 lump_sum_payments: [income.LumpSumPayment] = []):
+                 lump_sum_payments: [income.LumpSumPayment] = [],
+                 conversion_tax_percent: float = 0.0):
         self.income_tax_brackets = income_tax_brackets
         self.cap_gains_tax_brackets = cap_gains_tax_brackets
         self.post_tax_accounts = post_tax_accounts
@@ -123,50 +239,62 @@ class YearlyWithdrawManager:
         self.taxable_accounts = taxable_accounts
         self.pension_accounts = pension_accounts
         self.saving_accounts = taxable_accounts + post_tax_accounts + pre_tax_accounts
-        self.taxes_per_year = {}
+        self.taxes_per_year = YearTable()
         self.standard_deductions = standard_deductions
+        # the deduction follows the same inflation path as everything else
+        standard_deductions.set_inflate_percent_by_year(inflation_percent_by_year)
         self.market_increase_by_year = market_increase_by_year
         self.inflation_percent_by_year = inflation_percent_by_year
         self._lump_sum_payments = lump_sum_payments
+        # conversions fill the standard deduction and the brackets up to this rate
+        self.conversion_tax_percent = conversion_tax_percent
+        self._plan = None
 
-    def csv_header(self) -> str:
-        output = ""
+    def row_header(self) -> List[results.Column]:
+        output = []
         for acc in self.saving_accounts:
-            output += f"{acc.csv_header()}"
+            output.extend(acc.row_header())
 
         for acc in self.pension_accounts:
-            output += f"{acc.csv_header()}"
+            output.extend(acc.row_header())
 
         for bracket in self.cap_gains_tax_brackets.brackets:
-            output += f";{bracket.percentage}"
+            output.append(results.Column(f"{bracket.percentage}", results.MONEY))
 
-        output += ";standed"
+        output.append(results.Column("standed", results.MONEY))
 
-        output += YearlyTaxes.csv_header(self.income_tax_brackets.brackets)
+        output.extend(YearlyTaxes.row_header(self.income_tax_brackets.brackets))
 
-        output += ";market rate;inflation"
+        output.append(results.Column("market rate", results.PERCENT))
+        output.append(results.Column("inflation", results.PERCENT))
 
         return output
 
-    def csv(self, year: int) -> str:
-        output = ""
+    def row_values(self, year: int) -> List[float]:
+        output = []
         for acc in self.saving_accounts:
-            output += f"{acc.csv_values(year)}"
+            output.extend(acc.row_values(year))
 
         for acc in self.pension_accounts:
-            output += f"{acc.csv_values(year)}"
+            output.extend(acc.row_values(year))
 
         for bracket in self.cap_gains_tax_brackets.brackets:
-            output += f";${bracket.max_income:,.2f}"
+            output.append(bracket.max_income)
 
-        output += f";${self.standard_deductions.amount:,.2f}"
+        output.append(self.standard_deductions.amount)
 
-        output += self.taxes(year).csv()
-        output += f";{self.market_increase_by_year[year]*100:,.1f}%"
-        output += f";{self.inflation_percent_by_year[year]*100:,.1f}%"
+        output.extend(self.taxes(year).row_values())
+        output.append(self.market_increase_by_year[year])
+        output.append(self.inflation_percent_by_year[year])
 
         return output
 
+    def csv_header(self) -> str:
+        return results.format_header(self.row_header())
+
+    def csv(self, year: int) -> str:
+        return results.format_row(self.row_header(), self.row_values(year))
+
     def __str__(self):
         output = ""
 
@@ -185,17 +313,44 @@ class YearlyWithdrawManager:
 
         return output
 
-    def pay_taxes(self, amount: float, year: int):
-        for acc in self.taxable_accounts:
-            amount = acc.withdraw(amount, year)
-
-        for acc in self.post_tax_accounts:
-            amount = acc.withdraw(amount, year)
+    def balances(self) -> Dict[str, float]:
+        output = {}
+        for acc in self.saving_accounts:
+            output.update(acc.balances())
+        return output
 
-        for acc in self.pre_tax_accounts:
-            amount = acc.withdraw(amount, year)
+    def snapshot(self) -> tuple:
+        # brackets and deductions can be shared with the accounts, restoring them twice is harmless
+        return (self.taxes_per_year.copy(), list(self._lump_sum_payments), self.conversion_tax_percent,
+                self.income_tax_brackets.snapshot(), self.cap_gains_tax_brackets.snapshot(),
+                self.standard_deductions.snapshot(),
+                [acc.snapshot() for acc in self.saving_accounts],
+                [pension.snapshot() for pension in self.pension_accounts])
+
+    def restore(self, state: tuple):
+        (taxes_per_year, lump_sum_payments, self.conversion_tax_percent, income_tax_brackets, cap_gains_tax_brackets, standard_deductions,
+         account_states, pension_states) = state
+        self.taxes_per_year = taxes_per_year.copy()
+        self._lump_sum_payments = list(lump_sum_payments)
+        self.income_tax_brackets.restore(income_tax_brackets)
+        self.cap_gains_tax_brackets.restore(cap_gains_tax_brackets)
+        self.standard_deductions.restore(standard_deductions)
+        for acc, account_state in zip(self.saving_accounts, account_states):
+            acc.restore(account_state)
+        for pension, pension_state in zip(self.pension_accounts, pension_states):
+            pension.restore(pension_state)
+        # the plan has fixed the required withdraws of a year that may not have happened now
+        self._plan = None
+
+    def withdraw_plan(self) -> WithdrawPlan:
+        plan = self._plan
+        if plan is None or not plan.compiled_for(self.taxable_accounts, self.post_tax_accounts,
+                                                 self.pre_tax_accounts):
+            plan = self._plan = WithdrawPlan(self.taxable_accounts, self.post_tax_accounts, self.pre_tax_accounts)
+        return plan
 
-        return amount
+    def pay_taxes(self, amount: float, year: int):
+        return self.withdraw_plan().withdraw(amount, year)
 
     def set_total_predicted_income_taxes(self, year):
         amount = 0
@@ -210,21 +365,45 @@ class YearlyWithdrawManager:
         # if income tax is not over total standard deduction
         # request conversions
         taxable_income = self._total_taxable_income(year)
-        if taxable_income < self.standard_deductions.amount:
-            amount_to_convert = self.standard_deductions.amount - taxable_income
+        ceiling = self.conversion_ceiling()
+        if taxable_income < ceiling:
+            amount_to_convert = ceiling - taxable_income
             for acc in self.post_tax_accounts:
                 amount_to_convert = acc.conversion(amount_to_convert, year)
 
             # add to roth
-            self.pre_tax_accounts[0].add(self.standard_deductions.amount - taxable_income - amount_to_convert, year)
+            self.pre_tax_accounts[0].add(ceiling - taxable_income - amount_to_convert, year)
             # add to taxable
             # self.taxable_accounts[0].add(self.standard_deductions.amount - taxable_income - amount_to_convert, year)
 
+    def conversion_ceiling(self) -> float:
+        bracket = self.income_tax_brackets.find_closest_bracket_below_percent(self.conversion_tax_percent)
+        if not bracket:
+            return self.standard_deductions.amount
+        return self.standard_deductions.amount + bracket.max_income
+
     def lump_sum_payments(self, year):
         for payment in self._lump_sum_payments:
             if payment.year == year:
                 self.taxable_accounts[0].add(payment.amount, year)
 
+    def lump_sum_amount(self, year: int) -> float:
+        return sum(payment.amount for payment in self._lump_sum_payments if payment.year == year)
+
+    def projected_monthly_pension(self, year: int) -> Optional[float]:
+        amount = 0
+        for pension in self.pension_accounts:
+            payment = pension.projected_payment(year)
+            if payment is None:
+                return None
+            amount += payment
+
+        return amount
+
+    def monthly_growth_bound(self, year: int) -> float:
+        # no saving account grows faster than this in a month of year
+        return max([acc.monthly_growth_bound(year) for acc in self.saving_accounts] + [1.0])
+
     def monthly_pension(self, year: int) -> float:
         amount = 0
         for pension in self.pension_accounts:
@@ -232,6 +411,13 @@ class YearlyWithdrawManager:
 
         return amount
 
+    def yearly_pension(self, year: int) -> float:
+        amount = 0
+        for pension in self.pension_accounts:
+            amount += pension.yearly_payment(year)
+
+        return amount
+
     def inflate(self, year: int):
         self.income_tax_brackets.inflate(year)
         self.cap_gains_tax_brackets.inflate(year)
@@ -248,16 +434,7 @@ class YearlyWithdrawManager:
             pension.increase(year, month)
 
     def withdraw(self, amount: float, year: int) -> float:
-        for acc in self.taxable_accounts:
-            amount = acc.withdraw(amount, year)
-
-        for acc in self.post_tax_accounts:
-            amount = acc.withdraw(amount, year)
-
-        for acc in self.pre_tax_accounts:
-            amount = acc.withdraw(amount, year)
-
-        return amount
+        return self.withdraw_plan().withdraw(amount, year)
 
     def taxes(self, year: int) -> YearlyTaxes:
         if year in self.taxes_per_year:
@@ -265,9 +442,11 @@ class YearlyWithdrawManager:
         else:
             taxable_income = self._total_taxable_income(year)
             cap_gains = self._total_cap_gains(year)
-            income_taxes, income_brackets = self._calc_income_taxes(taxable_income)
+            income_taxes = self._calc_income_taxes(taxable_income)
             cap_gains_taxes = self._calc_cap_gains_taxes(taxable_income, cap_gains)
-            yearly_taxes = YearlyTaxes(cap_gains_taxes, income_taxes, income_brackets)
+            income_brackets = functools.partial(self._calc_income_brackets, self.income_tax_brackets.thresholds,
+                                                taxable_income - self.standard_deductions.amount)
+            yearly_taxes = YearlyTaxes(cap_gains_taxes, income_taxes, build_income_brackets=income_brackets)
             self.taxes_per_year[year] = yearly_taxes
 
             return yearly_taxes
@@ -281,29 +460,29 @@ class YearlyWithdrawManager:
             cap_over_first_bracket = total_cap_gains - cap_under_first_bracket
             return cap_over_first_bracket * self.cap_gains_tax_brackets.brackets[1].percentage
 
-    def _calc_income_taxes(self, taxable_income: float) -> Tuple[float, List[YearlyTaxBracket]]:
-        taxes = 0.0
-        previous_max = 0.0
+    def _calc_income_taxes(self, taxable_income: float) -> float:
         taxable_income_after_deductions = taxable_income - self.standard_deductions.amount
         if taxable_income_after_deductions < 0.0:
-            return 0.0, []
+            return 0.0
+
+        return self.income_tax_brackets.tax_for_income(taxable_income_after_deductions)
 
+    def _calc_income_brackets(self, thresholds: List[float],
+                              taxable_income_after_deductions: float) -> List[YearlyTaxBracket]:
+        previous_max = 0.0
         yearly_brackets = []
-        for bracket in self.income_tax_brackets.brackets:
-            if taxable_income_after_deductions > bracket.max_income:
-                taxes += (bracket.max_income - previous_max) * bracket.percentage
-                previous_max = bracket.max_income
-                yearly_brackets.append(YearlyTaxBracket(bracket, bracket.max_income))
+        for bracket, max_income in zip(self.income_tax_brackets.brackets, thresholds):
+            if taxable_income_after_deductions > max_income:
+                yearly_brackets.append(YearlyTaxBracket(bracket, max_income))
             else:
                 amount_bracket = taxable_income_after_deductions - previous_max
                 if amount_bracket > 0:
-                    taxes += amount_bracket * bracket.percentage
                     yearly_brackets.append(YearlyTaxBracket(bracket, amount_bracket))
                 else:
                     yearly_brackets.append(YearlyTaxBracket(bracket, 0))
-                previous_max = bracket.max_income
+            previous_max = max_income
 
-        return taxes, yearly_brackets
+        return yearly_brackets
 
     def _total_taxable_income(self, year: int) -> float:
         amount = 0.0
@@ -326,5 +505,6 @@ class YearlyWithdrawManager:
         for acc in self.saving_accounts:
             amount += acc.cap_taxable_income(year)
 
-        return amount
+        # selling below the basis after a down market realizes a loss, it offsets gains but isn't taxed back
+        return max(amount, 0.0)
 